@@ -0,0 +1,205 @@
+"""Seekable block-compressed archives of festivals: each lineup is compressed on its own
+"""
+
+
+from datetime import date
+import json
+import lzma
+import re
+import struct
+import zlib
+
+from woodstock.music.festival import Festival
+from woodstock.music.serialization import build, to_json
+from woodstock.util import utility
+from woodstock.util.dates import date_py_to_json, date_json_to_py
+
+
+# An archive file is MAGIC, followed by the blocks, the footer and the trailer:
+#   blocks:  the flat JSON of each lineup (to_json()), compressed on its own (zlib or lzma)
+#   footer:  the index, JSON compressed with zlib:
+#            {"codec": "zlib", "festivals": [{"name": ..., "location": ..., "start": ..., "end": ...,
+#                                             "lineups": [["1969-08-15", offset, size, raw size], ...]}, ...]}
+#   trailer: the offset and size of the footer, and MAGIC again
+# So reading one lineup means reading the trailer and the footer once, and then seeking to and decompressing
+# just the lineup's block, not the whole file.
+
+MAGIC = b'WSTKARC1'
+TRAILER = struct.Struct('<QQ8s')
+CODECS = {'zlib': (zlib.compress, zlib.decompress), 'lzma': (lzma.compress, lzma.decompress)}
+
+
+def archive_path(name):
+    """Returns the default path of the archive of the festival called name, in the data directory.
+    """
+
+    return utility.get_data_dir() / (re.sub(r'[^\w.-]+', '_', name) + '.archive')
+
+
+def write_archive(path, festivals, codec='zlib'):
+    """Writes festivals (a Festival or an iterable of festivals) to the archive file at path,
+    with the lineups compressed with codec ('zlib' or 'lzma').
+    """
+
+    compress = CODECS[codec][0]
+    festivals = [festivals] if isinstance(festivals, Festival) else festivals
+    index = {'codec': codec, 'festivals': []}
+    with open(path, 'wb') as fp:
+        fp.write(MAGIC)
+        for festival in festivals:
+            entries = []
+            for lineup in festival.lineups if isinstance(festival.lineups, tuple) else ():
+                raw = to_json(lineup).encode()
+                block = compress(raw)
+                entries.append([date_py_to_json(lineup.date), fp.tell(), len(block), len(raw)])
+                fp.write(block)
+            index['festivals'].append({'name': festival.name, 'location': festival.location,
+                                       'start': date_py_to_json(festival.start), 'end': date_py_to_json(festival.end),
+                                       'lineups': entries})
+        footer = zlib.compress(json.dumps(index).encode())
+        offset = fp.tell()
+        fp.write(footer)
+        fp.write(TRAILER.pack(offset, len(footer), MAGIC))
+
+
+class Archive:
+    """An archive file opened for reading (see write_archive()); the index is read when the archive is opened,
+    and each lineup is read and decompressed only when asked for.
+    The festivals are kept in the order of the archive, so several festivals can have the same name (select one
+    of them by n, counting from 0), and the lineups of a festival by position, so several lineups can have the same
+    date (lineup() returns the first of them, as Festival.lineup_on() does; festival() returns all of them).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__fp = open(path, 'rb')
+        self.__fp.seek(-TRAILER.size, 2)
+        offset, size, magic = TRAILER.unpack(self.__fp.read(TRAILER.size))
+        if magic != MAGIC:
+            self.__fp.close()
+            raise ValueError(f'{path}: not an archive file')
+        self.__fp.seek(offset)
+        index = json.loads(zlib.decompress(self.__fp.read(size)))
+        self.codec = index['codec']
+        self.__decompress = CODECS[self.codec][1]
+        self.__festivals = index['festivals']                   # in archive order
+        self.__by_name = {}                                     # name -> the positions of its festivals
+        self.__by_date = {}                                     # (festival position, date) -> its first lineup
+        for i, f in enumerate(self.__festivals):
+            self.__by_name.setdefault(f['name'], []).append(i)
+            for j, entry in enumerate(f['lineups']):
+                self.__by_date.setdefault((i, date_json_to_py(entry[0])), j)
+
+    def close(self):
+        self.__fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def festivals(self):
+        """The names of the festivals in the archive, in archive order (a name appears once for each festival).
+        """
+
+        return [f['name'] for f in self.__festivals]
+
+    def __position(self, name, n):
+        # The position of the n-th festival called name; KeyError if there is none
+        positions = self.__by_name[name]
+        if not 0 <= n < len(positions):
+            raise KeyError((name, n))
+        return positions[n]
+
+    def dates(self, name, n=0):
+        f = self.__festivals[self.__position(name, n)]
+        return [date_json_to_py(d) for d, offset, size, raw_size in f['lineups']]
+
+    def __read(self, entry):
+        d, offset, size, raw_size = entry
+        self.__fp.seek(offset)
+        return build(json.loads(self.__decompress(self.__fp.read(size))))
+
+    def lineup(self, name, d, n=0):
+        """Returns the (first) lineup on date d of the (n-th) festival called name, decompressing just its block.
+        Raises KeyError if there is no such lineup.
+        """
+
+        i = self.__position(name, n)
+        return self.__read(self.__festivals[i]['lineups'][self.__by_date[(i, d)]])
+
+    def festival(self, name, n=0):
+        """Returns the (n-th) festival called name, with all its lineups.
+        """
+
+        f = self.__festivals[self.__position(name, n)]
+        return Festival(f['name'], f['location'], date_json_to_py(f['start']), date_json_to_py(f['end']),
+                        *[self.__read(entry) for entry in f['lineups']])
+
+    def compression_ratio(self):
+        """Returns the ratio of the size of the lineups' JSON to the size of their compressed blocks.
+        """
+
+        raw, compressed = 0, 0
+        for f in self.__festivals:
+            for d, offset, size, raw_size in f['lineups']:
+                raw += raw_size
+                compressed += size
+        return raw / compressed if compressed else 1.0
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    from datetime import timedelta
+    from random import seed, randrange
+    from timeit import timeit
+
+    from woodstock.music.lineup import Lineup
+    from woodstock.music.performer import Performer
+
+    # Data: 20 years of a festival, 30 lineups x 1000 performers a year, drawn from 5000 performers
+    seed(1969)
+    performers = [Performer(f'Performer {i}', is_band=i % 2 == 0) for i in range(5000)]
+    festivals = []
+    for year in range(1969, 1989):
+        start = date(year, 7, 1)
+        festivals.append(Festival(f'Woodstock {year}', 'Bethel (NY)', start, start + timedelta(days=29),
+                                  *[Lineup(*performers[randrange(4000):][:1000], date=start + timedelta(days=i))
+                                    for i in range(30)]))
+
+    for codec in CODECS:
+        path = utility.get_data_dir() / f'woodstock_history.{codec}.archive'
+        print(codec, 'write:', timeit(lambda: write_archive(path, festivals, codec), number=1))
+        with Archive(path) as archive:
+            print(f'{path.stat().st_size:,} bytes, compression ratio {archive.compression_ratio():.1f}')
+            n = 100
+            names = archive.festivals
+            keys = [(names[randrange(len(names))], randrange(30)) for _ in range(n)]
+            t = timeit(lambda: [archive.lineup(name, archive.dates(name)[i]) for name, i in keys], number=1)
+            print(f'random lineup read: {t / n * 1000:.2f} ms')
+            print(archive.festival('Woodstock 1975') == festivals[6])
+        path.unlink()
+
+    # Festival API
+    festivals[0].to_archive()
+    print(Festival.from_archive('Woodstock 1969') == festivals[0])
+    print(Festival.lineup_from_archive('Woodstock 1969', date(1969, 7, 2)) == festivals[0].lineups[1])
+    archive_path('Woodstock 1969').unlink()
+
+    # Lineups on the same date and festivals with the same name round-trip (in order), none of them is lost
+    day2 = date(1969, 8, 16)
+    f = Festival('F', 'Bethel (NY)', date(1969, 8, 15), date(1969, 8, 18),
+                 Lineup(Performer('A'), date=day2), Lineup(Performer('B'), date=day2),
+                 Lineup(Performer('C'), date=date(1969, 8, 17)))
+    g = Festival('F', 'Woodstock (NY)', date(1969, 8, 15), date(1969, 8, 18), Lineup(Performer('D'), date=day2))
+    path = utility.get_data_dir() / 'duplicates.archive'
+    write_archive(path, [f, g])
+    with Archive(path) as archive:
+        print(archive.festivals, archive.festival('F') == f, archive.festival('F', 1) == g)
+        print([str(lineup) for lineup in archive.festival('F').lineups])
+        print(archive.lineup('F', day2) == f.lineups[0], archive.lineup('F', day2, 1) == g.lineups[0])
+    path.unlink()
@@ -0,0 +1,147 @@
+"""Bulk text import/export of performers: one performer per line, in the format of Performer.__str__()
+"""
+
+
+from itertools import islice
+import mmap
+from multiprocessing import Pool
+
+from woodstock.music.performer import Performer
+
+
+# Reading a text file line by line and calling Performer.from_str() on each line costs a readline(), a split()
+# and a validating constructor call per performer. The bulk reader maps the file with mmap instead, cuts it into
+# large chunks at line boundaries, and parses each chunk as a whole: one decode() and one split('\n') per chunk,
+# and the names and is_band flags in two list comprehensions. Constructing the Performer objects still dominates,
+# so the serial gain is modest (about 15% more lines/s than readline() + from_str() on a single CPU).
+# Optionally, the chunks are parsed in a pool of several processes; the workers read their chunks from the file
+# themselves and send back just the columns (the names joined by newlines, which cannot occur in a name, and
+# the is_band flags as bytes), not pickled Performer objects. The pool only pays off with several cores: with one,
+# the IPC makes it slower than the serial reader. Performers are yielded lazily, a chunk at a time.
+
+CHUNK_SIZE = 1 << 22                                            # bytes
+WRITE_BATCH = 10_000                                            # performers per write()
+
+
+def parse_performers(text):
+    """Returns the columns (names, is_band flags) of the performers in text, one per line in the format of __str__().
+    Gives the same name and is_band as Performer.from_str() on each line.
+    """
+
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    # from_str(): split(' (')[0] == 'unknown' -> unknown band; split(' (')[-1] == 'solo performer)' -> solo performer
+    names = [line.partition(' (')[0].rstrip() or 'unknown' for line in lines]
+    bands = [line.startswith('unknown (') or not (line.endswith(' (solo performer)') or line == 'solo performer)')
+             for line in lines]
+    return names, bands
+
+
+def chunk_bounds(mm, chunk_size=CHUNK_SIZE):
+    """Returns the (start, end) byte offsets of the chunks of the mapped file mm;
+    each chunk is about chunk_size bytes and ends right after a newline (or at the end of the file).
+    """
+
+    bounds = []
+    start, size = 0, len(mm)
+    while start < size:
+        end = mm.find(b'\n', start + chunk_size - 1)
+        end = size if end == -1 else end + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def parse_file_chunk(args):
+    # Runs in the pool workers
+    path, start, end = args
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        names, bands = parse_performers(fp.read(end - start).decode())
+    return '\n'.join(names), bytes(bands)
+
+
+def read_performers(path, chunk_size=CHUNK_SIZE, processes=None, registry=None):
+    """Yields the performers from the text file at path, one per line in the format of __str__().
+    The file is memory-mapped and parsed in chunks of about chunk_size bytes, in a pool of processes if more than
+    one is specified (otherwise in this process).
+    If registry (a PerformerRegistry) is specified, yields the shared instances from the registry.
+    """
+
+    with open(path, 'rb') as fp:
+        if fp.seek(0, 2) == 0:                                  # mmap can't map an empty file
+            return
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = chunk_bounds(mm, chunk_size)
+            if processes is not None and processes > 1:
+                with Pool(processes) as pool:
+                    for names, bands in pool.imap(parse_file_chunk, [(path, start, end) for start, end in bounds]):
+                        yield from make_performers(names.split('\n'), bands, registry)
+            else:
+                for start, end in bounds:
+                    yield from make_performers(*parse_performers(mm[start:end].decode()), registry)
+
+
+def make_performers(names, bands, registry=None):
+    # The plain constructor call is faster than building the objects' __dict__ directly (cf. unpickle_performer())
+    if registry is not None:
+        return [registry.get(name, bool(is_band)) for name, is_band in zip(names, bands)]
+    return [Performer(name, bool(is_band)) for name, is_band in zip(names, bands)]
+
+
+def write_performers(path, performers, batch=WRITE_BATCH):
+    """Writes performers to the text file at path, one per line in the format of __str__(),
+    in batches of batch performers joined into a single write().
+    """
+
+    performers = iter(performers)
+    with open(path, 'w', encoding='utf-8', newline='\n') as fp:
+        while chunk := list(islice(performers, batch)):
+            fp.write('\n'.join(map(str, chunk)) + '\n')
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    import os
+    from timeit import timeit
+
+    from woodstock.util import utility
+
+    # Data: 2,000,000 performers, a few of them unknown
+    n = 2_000_000
+    performers = [Performer(f'Performer {i}' if i % 1000 else '', is_band=i % 3 == 0) for i in range(n)]
+    path = utility.get_data_dir() / 'performers.txt'
+
+    # Writing: a write() per performer vs. write_performers()
+    def write_lines():
+        with open(path, 'w') as fp:
+            for p in performers:
+                fp.write(str(p) + '\n')
+
+    t1, t2 = timeit(write_lines, number=1), timeit(lambda: write_performers(path, performers), number=1)
+    print(f'write, line by line:     {n / t1:12,.0f} lines/s')
+    print(f'write_performers():      {n / t2:12,.0f} lines/s')
+
+    # Reading: readline() + Performer.from_str() vs. read_performers(), serial and in a process pool
+    def read_lines():
+        result = []
+        with open(path) as fp:
+            while line := fp.readline():
+                result.append(Performer.from_str(line.rstrip('\n')))
+        return result
+
+    expected = read_lines()
+    t = timeit(read_lines, number=1)
+    print(f'read, readline/from_str: {n / t:12,.0f} lines/s')
+    for processes in None, os.cpu_count():
+        t = timeit(lambda: list(read_performers(path, processes=processes)), number=1)
+        label = f'read_performers({processes}):'
+        print(f'{label:25}{n / t:12,.0f} lines/s')
+    result = list(read_performers(path, chunk_size=1 << 16, processes=2))
+    print(result == expected, all(str(p) == str(q) and p.is_band == q.is_band for p, q in zip(result, expected)))
+    path.unlink()
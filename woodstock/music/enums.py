@@ -2,14 +2,14 @@
 """
 
 
-from enum import Enum
+from enum import Enum, IntFlag
 
 
 class Vocals(Enum):
     """Types of vocals in rock 'n' roll.
     """
 
-    LEAD_VOCALS = 1,
+    LEAD_VOCALS = 1
     BACKGROUND_VOCALS = 2
 
 
@@ -17,8 +17,32 @@ class Instrumet(Enum):
     """Typical instruments in rock 'n' roll.
     """
 
-    LEAD_GUITAR = 1,
-    RHYTHM_GUITAR = 2,
-    BASS = 3,
-    DRUMS = 4,
-    PIANO = 5,
+    LEAD_GUITAR = 1
+    RHYTHM_GUITAR = 2
+    BASS = 3
+    DRUMS = 4
+    PIANO = 5
+
+
+class Role(IntFlag):
+    """Roles of performers in rock 'n' roll as bit flags, so that a single int describes all the roles
+    of a performer (e.g., Role.LEAD_VOCALS | Role.BASS | Role.SONGWRITER).
+    Each Vocals and Instrumet member has the Role flag of the same name.
+    """
+
+    NONE = 0
+    LEAD_VOCALS = 1
+    BACKGROUND_VOCALS = 2
+    LEAD_GUITAR = 4
+    RHYTHM_GUITAR = 8
+    BASS = 16
+    DRUMS = 32
+    PIANO = 64
+    SONGWRITER = 128
+
+    @classmethod
+    def of(cls, member):
+        """Returns the Role flag of a Vocals or Instrumet member (Role.NONE for None).
+        """
+
+        return cls[member.name] if member is not None else cls.NONE
@@ -2,7 +2,10 @@
 """
 
 
+from bisect import bisect_left, bisect_right
 from datetime import date
+import hashlib
+from operator import attrgetter
 import sys
 from pickle import dump, load
 
@@ -17,25 +20,234 @@ class Festival:
     It includes a name, a list of Lineup objects (lineups by date), location and the start and end dates.
     """
 
-    def __init__(self, name, location, start, end, *lineups):
+    def __init__(self, name, location, start, end, *lineups, report_all=False):
+        """Validates the lineups in a single pass (see validate_lineups()). Raises LineupDateException
+        for the first lineup with a wrong date or, if report_all is True, FestivalValidationException
+        with all the violations (wrong dates and non-Lineup objects). As before, if there are non-Lineup objects
+        in lineups and report_all is False, the festival's lineups are 'unknown'.
+        """
+
         if start > end:
             raise FestivalStartDateException(start, end)
-        elif not all([check_lineup_date(lineup, start, end) for lineup in lineups]):
-            wrong_date_lineups = [lineup for lineup in lineups if not check_lineup_date(lineup, start, end)]
-            raise LineupDateException(wrong_date_lineups[0], start, end)
-        else:
-            self.name = name if name and isinstance(name, str) else 'unknown'
-            self.location = location if location and isinstance(location, str) else 'unknown'
-            self.start = start if start and isinstance(start, date) else 'unknown'
-            self.end = end if end and isinstance(end, date) else 'unknown'
-            self.lineups = lineups if lineups and all([isinstance(lineup, Lineup) for lineup in lineups]) else 'unknown'
+        errors = validate_lineups(lineups, start, end)
+        if errors and report_all:
+            raise FestivalValidationException(errors)
+        for error in errors:
+            if isinstance(error, LineupDateException):
+                raise error
+        self.name = name
+        self.location = location
+        self.start = start
+        self.end = end
+        # Not through the lineups property, which would validate all lineups once again
+        self.__lineups = 'unknown'
+        self.__set_lineups(lineups if not errors else ())
+
+    # All data fields are properties, so that changing them invalidates the cached fingerprint
+
+    @property
+    def name(self):
+        return self.__name
+
+    @name.setter
+    def name(self, name):
+        self.__name = name if name and isinstance(name, str) else 'unknown'
+        self.__fingerprint = None
+
+    @property
+    def location(self):
+        return self.__location
+
+    @location.setter
+    def location(self, location):
+        self.__location = location if location and isinstance(location, str) else 'unknown'
+        self.__fingerprint = None
+
+    @property
+    def start(self):
+        return self.__start
+
+    @start.setter
+    def start(self, start):
+        self.__start = start if start and isinstance(start, date) else 'unknown'
+        self.__fingerprint = None
+
+    @property
+    def end(self):
+        return self.__end
+
+    @end.setter
+    def end(self, end):
+        self.__end = end if end and isinstance(end, date) else 'unknown'
+        self.__fingerprint = None
+
+    @property
+    def lineups(self):
+        return self.__lineups
+
+    @lineups.setter
+    def lineups(self, lineups):
+        """Validates the new lineups as __init__() does: raises LineupDateException for the first lineup
+        with a date out of the festival's range; the lineups are 'unknown' if there are non-Lineup objects.
+        """
+
+        lineups = tuple(lineups) if lineups else ()
+        errors = validate_lineups(lineups, self.start, self.end)
+        for error in errors:
+            if isinstance(error, LineupDateException):
+                raise error
+        self.__set_lineups(lineups if not errors else ())
+
+    # Date index: the lineups are kept sorted by date (a stable sort, so lineups on the same date keep their order),
+    # with the list of their dates, so lookups by date and date ranges are binary searches, and with the list of
+    # their order numbers (the order of addition), which orders the lineups on the same date. Each lineup knows
+    # the festivals it is in (Lineup._attach()); a new date is validated by them (_check_lineup_date()) and
+    # moves the lineup to its place (_lineup_date_changed()).
+
+    def __set_lineups(self, lineups):
+        if isinstance(self.__lineups, tuple):
+            for lineup in self.__lineups:
+                lineup._detach(self)
+        lineups = tuple(sorted(lineups, key=lineup_date))
+        for lineup in lineups:
+            lineup._attach(self)
+        self.__lineups = lineups or 'unknown'
+        self.__dates = [lineup.date for lineup in lineups]
+        self.__order = list(range(len(lineups)))
+        self.__added = len(lineups)
+        self.__fingerprint = None
+
+    def _check_lineup_date(self, lineup):
+        # Called by the date setter of one of the lineups, with the new date already set: returns
+        # LineupDateException if it is out of the festival's range (the setter then restores the old date)
+        errors = validate_lineups((lineup,), self.start, self.end)
+        return errors[0] if errors else None
+
+    def _lineup_date_changed(self, lineup, old):
+        # Moves the lineup from among the lineups on date old to its place among the lineups on its new date,
+        # by its order number, so that changing a date and then restoring it also restores the order
+        if isinstance(self.__lineups, tuple) and lineup.date != old:
+            lineups, dates, order = list(self.__lineups), self.__dates, self.__order
+            d = lineup.date
+            while True:                                         # (for each occurrence of the lineup)
+                i = next((k for k in range(bisect_left(dates, old), bisect_right(dates, old))
+                          if lineups[k] is lineup), None)
+                if i is None:
+                    break
+                del lineups[i], dates[i]
+                n = order.pop(i)
+                j = bisect_left(order, n, bisect_left(dates, d), bisect_right(dates, d))
+                lineups.insert(j, lineup)
+                dates.insert(j, d)
+                order.insert(j, n)
+            self.__lineups = tuple(lineups)
+        self.__fingerprint = None
+
+    def _lineup_changed(self):
+        self.__fingerprint = None                              # one of the lineups was changed (see Lineup.__changed())
+
+    def lineup_on(self, d):
+        """Returns the (first) lineup on date d, in O(log n). Raises KeyError if there is none.
+        """
+
+        lineups = self.lineups                                  # first (a LazyFestival decodes its lineups here)
+        dates = self.__dates
+        i = bisect_left(dates, d)
+        if i == len(dates) or dates[i] != d:
+            raise KeyError(d)
+        return lineups[i]
+
+    def lineups_between(self, start, end):
+        """Returns the tuple of the lineups with dates from start to end (inclusive), in date order.
+        """
+
+        lineups = self.lineups
+        dates = self.__dates
+        return lineups[bisect_left(dates, start):bisect_right(dates, end)] if dates else ()
+
+    def add_lineup(self, lineup):
+        """Inserts lineup in date order (after the lineups on the same date), validating just the new lineup.
+        Raises LineupTypeException or LineupDateException if it is not a Lineup or its date is out of range.
+        """
+
+        errors = validate_lineups((lineup,), self.start, self.end)
+        if errors:
+            raise errors[0]
+        lineups = self.lineups if isinstance(self.lineups, tuple) else ()
+        i = bisect_right(self.__dates, lineup.date)
+        self.__lineups = lineups[:i] + (lineup,) + lineups[i:]
+        self.__dates.insert(i, lineup.date)
+        self.__order.insert(i, self.__added)                    # the last one added
+        self.__added += 1
+        lineup._attach(self)
+        self.__fingerprint = None
+
+    @property
+    def fingerprint(self):
+        """64-bit content fingerprint of the festival: a BLAKE2 hash of its name, location, start and end dates
+        and the fingerprints of its lineups (see Lineup.fingerprint). Cached until the festival or one of
+        its own lineups is changed (each lineup resets it, see _lineup_changed()).
+        """
+
+        lineups = self.lineups                                  # first (a LazyFestival decodes its lineups here)
+        if self.__fingerprint is None:
+            h = hashlib.blake2b(f'{self.name}\x00{self.location}\x00{self.start}\x00{self.end}'.encode(),
+                                digest_size=8)
+            for lineup in lineups if isinstance(lineups, tuple) else ():
+                h.update(lineup.fingerprint.to_bytes(8, 'big', signed=True))
+            self.__fingerprint = int.from_bytes(h.digest(), 'big', signed=True)
+        return self.__fingerprint
 
     def __str__(self):
         lineups = '\n\t'.join(str(lineup) for lineup in self.lineups)
         return f'{self.name} ({format_date(self.start)} - {format_date(self.end)})' + '\n\t' + lineups
 
     def __eq__(self, other):
-        return self == other if isinstance(other, Festival) else False
+        # Structural equality: different fingerprints decide it quickly, equal ones are confirmed by comparing
+        # the fields and the lineups (see Lineup.__eq__()); the old version, self == other, raised RecursionError
+        if not isinstance(other, Festival):
+            return False
+        return self is other or (self.fingerprint == other.fingerprint and
+                                 (self.name, self.location, self.start, self.end, self.lineups) ==
+                                 (other.name, other.location, other.start, other.end, other.lineups))
+
+    def __hash__(self):
+        return self.fingerprint                                 # don't change a festival while it is in a set
+
+    def __reduce__(self):
+        # Compact pickling: the data fields as a positional tuple (the lineups are pickled compactly as well,
+        # see Lineup.__reduce_ex__()); a LazyFestival is pickled as a regular festival, with all its lineups
+        return unpickle_festival, (self.name, self.location, self.start, self.end,
+                                   self.lineups if isinstance(self.lineups, tuple) else ())
+
+    # Block-compressed archives (see woodstock.music.archive, imported here to avoid a circular import);
+    # by default, each festival has its own archive in the data directory (archive_path())
+
+    def to_archive(self, path=None, codec='zlib'):
+        from woodstock.music.archive import archive_path, write_archive
+        write_archive(path or archive_path(self.name), self, codec)
+
+    @classmethod
+    def from_archive(cls, name, path=None):
+        from woodstock.music.archive import Archive, archive_path
+        with Archive(path or archive_path(name)) as archive:
+            return archive.festival(name)
+
+    @staticmethod
+    def lineup_from_archive(name, d, path=None):
+        """Reads just the lineup on date d of the festival called name from its archive.
+        """
+
+        from woodstock.music.archive import Archive, archive_path
+        with Archive(path or archive_path(name)) as archive:
+            return archive.lineup(name, d)
+
+
+lineup_date = attrgetter('date')
+
+
+def unpickle_festival(name, location, start, end, lineups):
+    return Festival(name, location, start, end, *lineups)
 
 
 class FestivalError(Exception):
@@ -59,15 +271,51 @@ def check_lineup_date(lineup, start_date, end_date):
     return start_date <= lineup.date <= end_date
 
 
+def validate_lineups(lineups, start_date, end_date):
+    """Checks the types and the dates of all lineups in a single pass.
+    Returns the list of all violations found, as exceptions (LineupTypeException, LineupDateException),
+    in the order of lineups; the list is empty if all lineups are OK.
+    """
+
+    errors = []
+    for i, lineup in enumerate(lineups):
+        if not isinstance(lineup, Lineup):
+            errors.append(LineupTypeException(lineup, i))
+        elif not start_date <= lineup.date <= end_date:
+            errors.append(LineupDateException(lineup, start_date, end_date, i))
+    return errors
+
+
 class LineupDateException(FestivalError):
     """Exception raised when the date of a festival lineup is not between start and end dates of the festival.
     """
 
-    def __init__(self, lineup, start, end):
+    def __init__(self, lineup, start, end, index=None):
+        self.lineup = lineup
+        self.index = index
         self.message = f'lineup date ({format_date(lineup.date)}) not between start and end dates of the festival ' \
                        f'({format_date(start)} - {format_date(end)}).'
 
 
+class LineupTypeException(FestivalError):
+    """Exception raised when a festival lineup is not a Lineup object.
+    """
+
+    def __init__(self, lineup, index=None):
+        self.lineup = lineup
+        self.index = index
+        self.message = f'lineup {index} is not a Lineup object, but {lineup.__class__.__name__}.'
+
+
+class FestivalValidationException(FestivalError):
+    """Exception raised with the report of all violations found when validating the lineups of a festival.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.message = f'{len(errors)} invalid lineup(s):\n\t' + '\n\t'.join(e.message for e in errors)
+
+
 class FestivalEncoder(json.JSONEncoder):
     """JSON encoder for Festival objects.
     """
@@ -76,10 +324,11 @@ class FestivalEncoder(json.JSONEncoder):
         # recommendation: always use double quotes with JSON
 
         if isinstance(o, Festival):
-            d = o.__dict__.copy()
-            d['start'] = o.start.isoformat()
-            d['end'] = o.end.isoformat()
-            d['lineups'] = json.dumps(o.lineups, cls=LineupEncoder, indent=4)
+            d = {'name': o.name,
+                 'location': o.location,
+                 'start': date_py_to_json(o.start),
+                 'end': date_py_to_json(o.end),
+                 'lineups': json.dumps(o.lineups, cls=LineupEncoder, indent=4)}
             return {"__Festival__": d}
         return {f"__{o.__class__.name}__": o.__dict__}
 
@@ -89,11 +338,12 @@ def festival_json_to_py(festival_json):
     """
 
     if "__Festival__" in festival_json:
-        f = Festival('', '', date.today(), date.today())
-        f.__dict__.update(festival_json['__Festival__'])
-        f.start = date.fromisoformat(f.start)
-        f.end = date.fromisoformat(f.end)
-        f.lineups = tuple(json.loads(f.lineups, object_hook=lineup.lineup_json_to_py))
+        # The data fields are properties now, so the festival cannot be patched through its __dict__
+        # f = Festival('', '', date.today(), date.today())
+        # f.__dict__.update(festival_json['__Festival__'])
+        d = festival_json['__Festival__']
+        f = Festival(d['name'], d['location'], date_json_to_py(d['start']), date_json_to_py(d['end']),
+                     *json.loads(d['lineups'], object_hook=lineup.lineup_json_to_py))
         return f
     return festival_json
 
@@ -172,6 +422,15 @@ if __name__ == "__main__":
     # # print(woodstock)
     # print()
 
+    # Demonstrate exceptions - reporting all invalid lineups at once
+    try:
+        wrong_lineups = [Lineup(*day1_performers, date=date(1969, 8, 11)), 'day 2', day3_lineup,
+                         Lineup(*day3_performers, date=date(1969, 8, 19))]
+        Festival('Woodstock', 'Bethel (NY)', date(1969, 8, 15), date(1969, 8, 17), *wrong_lineups, report_all=True)
+    except FestivalValidationException as e:
+        print(f'Caught {e.__class__.__name__}: ' + e.message)
+    print()
+
     # try:
     #     # woodstock = Festival('Woodstock', 'Bethel (NY)', date(1969, 8, 18), date(1969, 8, 17), *lineups)
     #     day3_lineup = Lineup(*day3_performers, date=date(1969, 8, 11))
@@ -184,6 +443,56 @@ if __name__ == "__main__":
     # # print(woodstock)
     # print()
 
+    # Date index (lineup_on(), lineups_between(), add_lineup()) vs. linear scans:
+    # a festival series of 5000 daily lineups, 1000 random lookups
+    from datetime import timedelta
+    from random import seed, randrange
+    from timeit import timeit
+
+    seed(1969)
+    start = date(1969, 8, 15)
+    series = Festival('Series', 'USA', start, start + timedelta(days=9999),
+                      *[Lineup(Performer(f'Performer {i}'), date=start + timedelta(days=2 * i)) for i in range(5000)])
+    days = [start + timedelta(days=randrange(10000)) for _ in range(1000)]
+    scan = lambda d: next((lineup for lineup in series.lineups if lineup.date == d), None)
+
+    def indexed(d):
+        try:
+            return series.lineup_on(d)
+        except KeyError:
+            return None
+
+    print([scan(d) for d in days] == [indexed(d) for d in days])
+    print('lineup on, scan:   ', timeit(lambda: [scan(d) for d in days], number=1))
+    print('lineup on, bisect: ', timeit(lambda: [indexed(d) for d in days], number=1))
+    week = (start + timedelta(days=5000), start + timedelta(days=5006))
+    print(series.lineups_between(*week) == tuple(lineup for lineup in series.lineups
+                                                  if week[0] <= lineup.date <= week[1]))
+    print('week, scan:        ', timeit(lambda: [lineup for lineup in series.lineups
+                                                 if week[0] <= lineup.date <= week[1]], number=100) / 100)
+    print('week, bisect:      ', timeit(lambda: series.lineups_between(*week), number=100) / 100)
+    series.add_lineup(Lineup(theWho, date=start + timedelta(days=1)))
+    print(series.lineup_on(start + timedelta(days=1)).performers[0], series.lineups[1].date)
+    try:
+        series.add_lineup(Lineup(theWho, date=start - timedelta(days=1)))
+    except LineupDateException as e:
+        print(e.message)
+    series.lineups[0].date = start + timedelta(days=3)         # moves it among the lineups of the festival right away
+    print(series.lineup_on(start + timedelta(days=3)) is series.lineups[2], series.lineups[0].date)
+    try:
+        series.lineups[0].date = date(1999, 1, 1)               # out of the festival's range: the date is restored
+    except LineupDateException as e:
+        print(e.message, series.lineups[0].date, series.lineups_between(date(1999, 1, 1), date(1999, 1, 1)))
+    # Lineups on the same date keep their order when one of them is re-dated and then restored
+    day = date(1969, 8, 16)
+    weekend = Festival('Weekend', 'Bethel (NY)', date(1969, 8, 15), date(1969, 8, 18),
+                       Lineup(Performer('A'), date=day), Lineup(Performer('B'), date=day))
+    before = weekend.lineups
+    before[0].date = date(1969, 8, 17)
+    before[0].date = day
+    print(weekend.lineups == before, [str(lineup) for lineup in weekend.lineups])
+    print()
+
     # # Demonstrate writing to a text file
     # with open('performers.txt', 'w') as out:
     #     # for performer in day2_performers:
@@ -244,13 +553,46 @@ if __name__ == "__main__":
     print(woodstock_json)
     woodstock_py = json.loads(woodstock_json, object_hook=festival_json_to_py)
     print(woodstock_py)
-    # The following line causes # RecursionError: maximum recursion depth exceeded (???);
-    # see https://stackoverflow.com/questions/14749225/maximum-recursion-depth-exceeded-when-property-is-applied-to-instance-variab
-    # print(woodstock == woodstock_py)
+    # The following line used to cause RecursionError: maximum recursion depth exceeded, since __eq__() was
+    # implemented as self == other; now it compares the cached fingerprints
+    print(woodstock == woodstock_py, len({woodstock, woodstock_py}))
+    woodstock_py.lineups[0].date = date(1969, 8, 16)            # invalidates the cached fingerprints
+    print(woodstock == woodstock_py)
     print()
 
     # List of objects
     print()
 
-
-
+    # Compact pickling (Performer.__reduce_ex__(), Lineup.__reduce_ex__(), Festival.__reduce__()):
+    # size and time for 100 lineups x 1000 performers, mixed classes and plain performers
+    import pickle
+    from datetime import timedelta
+    from timeit import timeit
+
+    def new_performer(i, j):
+        if j % 4 == 1:
+            return Singer(name=f'Singer {i}-{j}', vocals=Vocals.LEAD_VOCALS)
+        if j % 4 == 2:
+            return Songwriter(name=f'Songwriter {i}-{j}', instrument=Instrumet.BASS)
+        if j % 4 == 3:
+            return SingerSongwriter(name=f'Singer-songwriter {i}-{j}', vocals=Vocals.LEAD_VOCALS,
+                                    instrument=Instrumet.PIANO)
+        return Performer(f'Performer {i}-{j}', is_band=j % 2 == 0)
+
+    start = date(1969, 8, 15)
+    mixed = Festival('Mixed', 'Bethel (NY)', start, start + timedelta(days=99),
+                     *[Lineup(*[new_performer(i, j) for j in range(1000)], date=start + timedelta(days=i))
+                       for i in range(100)])
+    plain = Festival('Plain', 'Bethel (NY)', start, start + timedelta(days=99),
+                     *[Lineup(*[Performer(f'Performer {i}-{j}', is_band=j % 2 == 0) for j in range(1000)],
+                              date=start + timedelta(days=i)) for i in range(100)])
+    for festival in mixed, plain:
+        for protocol in 4, 5:
+            s = pickle.dumps(festival, protocol=protocol)
+            print(f'{festival.name}, protocol {protocol}: {len(s):,} bytes,',
+                  f'dumps {timeit(lambda: pickle.dumps(festival, protocol=protocol), number=3) / 3:.3f} s,',
+                  f'loads {timeit(lambda: pickle.loads(s), number=3) / 3:.3f} s', pickle.loads(s) == festival)
+    buffers = []
+    s = pickle.dumps(plain, protocol=5, buffer_callback=buffers.append)       # out-of-band lineup columns
+    print(f'Plain, out-of-band: {len(s):,} bytes + {len(buffers)} buffers,',
+          pickle.loads(s, buffers=buffers) == plain)
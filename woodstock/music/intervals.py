@@ -0,0 +1,209 @@
+"""Interval index over a catalog of festivals: overlap and "what's on" queries by their start and end dates
+"""
+
+
+from itertools import count
+from random import random
+
+from woodstock.music.festival import Festival
+
+
+# The index is a treap (a binary search tree that is also a heap by random priorities, so it stays balanced in
+# expectation) of the festivals ordered by (start, end), augmented with the latest end date in each subtree.
+# A query for the festivals overlapping [start, end] skips every subtree whose latest end is before start, and stops
+# at the first festival that starts after end, so it takes O(log n + k) expected time for k results (instead of
+# comparing against all n festivals). Inserting and removing a festival take O(log n) expected time, and building
+# the index from a whole catalog takes O(n log n) (for the sort, then a linear-time build).
+
+
+class _Node:
+    __slots__ = ('key', 'festival', 'priority', 'max_end', 'left', 'right')
+
+    def __init__(self, key, festival):
+        self.key = key                                  # (start, end, sequence number): unique
+        self.festival = festival
+        self.priority = random()
+        self.max_end = key[1]
+        self.left = self.right = None
+
+
+def _update(node):
+    max_end = node.key[1]
+    if node.left is not None and node.left.max_end > max_end:
+        max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > max_end:
+        max_end = node.right.max_end
+    node.max_end = max_end
+
+
+def _split(node, key):
+    # Returns the treaps of the nodes with keys < key and >= key
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        _update(node)
+        return node, right
+    left, node.left = _split(node.left, key)
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    # All keys in left are less than all keys in right
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _remove(node, key):
+    if node is None:
+        return None
+    if key == node.key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _remove(node.left, key)
+    else:
+        node.right = _remove(node.right, key)
+    _update(node)
+    return node
+
+
+def _overlapping(node, start, end, result):
+    while node is not None and node.max_end >= start:
+        _overlapping(node.left, start, end, result)
+        if node.key[0] > end:                           # this festival and all in the right subtree start too late
+            return
+        if node.key[1] >= start:
+            result.append(node.festival)
+        node = node.right
+
+
+class IntervalIndex:
+    """Index of festivals by their [start, end] date intervals, for queries such as 'which festivals overlap
+    this window' (overlapping()) and 'what was running on this date' (on()), in logarithmic time.
+    Festivals are identified by identity, so a festival can be removed even if its dates have been changed
+    since it was inserted (the index keeps the dates it was inserted with, so re-insert it after such a change).
+    Festivals without proper start and end dates (e.g., 'unknown') are not indexed.
+    """
+
+    def __init__(self, festivals=()):
+        """Builds the index from festivals in one go: sorted once, then a linear-time treap build.
+        """
+
+        self.__root = None
+        self.__keys = {}                                # id(festival) -> key
+        self.__sequence = count()
+        nodes = sorted((_Node(self.__key(festival), festival) for festival in festivals if self.__valid(festival)),
+                       key=lambda node: node.key)
+        # Cartesian tree build: a stack of the right spine, each new (largest) node pops the lower-priority nodes
+        stack = []
+        for node in nodes:
+            self.__keys[id(node.festival)] = node.key
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+                _update(last)
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        for node in reversed(stack):
+            _update(node)
+        self.__root = stack[0] if stack else None
+
+    @staticmethod
+    def __valid(festival):
+        return isinstance(festival, Festival) and not isinstance(festival.start, str) \
+            and not isinstance(festival.end, str)
+
+    def __key(self, festival):
+        return festival.start, festival.end, next(self.__sequence)
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def __contains__(self, festival):
+        return id(festival) in self.__keys
+
+    def insert(self, festival):
+        """Inserts festival into the index; does nothing if it is already there or has no proper dates.
+        """
+
+        if id(festival) in self.__keys or not self.__valid(festival):
+            return
+        node = _Node(self.__key(festival), festival)
+        self.__keys[id(festival)] = node.key
+        left, right = _split(self.__root, node.key)
+        self.__root = _merge(_merge(left, node), right)
+
+    def remove(self, festival):
+        """Removes festival from the index. Raises KeyError if it is not there.
+        """
+
+        self.__root = _remove(self.__root, self.__keys.pop(id(festival)))
+
+    def overlapping(self, start, end):
+        """Returns the festivals whose dates overlap [start, end] (both inclusive), ordered by start date.
+        """
+
+        result = []
+        _overlapping(self.__root, start, end, result)
+        return result
+
+    def on(self, d):
+        """Returns the festivals running on date d, ordered by start date.
+        """
+
+        return self.overlapping(d, d)
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    from datetime import date, timedelta
+    from random import seed, randrange
+    from timeit import timeit
+
+    # Data
+    woodstock = Festival('Woodstock', 'Bethel (NY)', date(1969, 8, 15), date(1969, 8, 18))
+    isleOfWight = Festival('Isle of Wight', 'Isle of Wight (UK)', date(1969, 8, 29), date(1969, 8, 31))
+    altamont = Festival('Altamont', 'Tracy (CA)', date(1969, 12, 6), date(1969, 12, 6))
+    index = IntervalIndex([woodstock, isleOfWight, altamont])
+    print([f.name for f in index.on(date(1969, 8, 16))])
+    print([f.name for f in index.overlapping(date(1969, 8, 18), date(1969, 12, 31))])
+    index.remove(woodstock)
+    print([f.name for f in index.overlapping(date(1969, 8, 1), date(1969, 8, 31))], len(index))
+    print()
+
+    # 50,000 festivals over 30 years, mostly 1-10 days long, some of them season-long series;
+    # 1000 'what's on' queries and 1000 one-week overlap queries, index vs. comparing against all festivals
+    seed(1969)
+    first = date(1969, 1, 1)
+    catalog = []
+    for i in range(50_000):
+        start = first + timedelta(days=randrange(30 * 365))
+        days = randrange(1, 11) if i % 100 else randrange(30, 180)
+        catalog.append(Festival(f'Festival {i}', 'USA', start, start + timedelta(days=days - 1)))
+    print('build:', timeit(lambda: IntervalIndex(catalog), number=1))
+    index = IntervalIndex(catalog)
+    days = [first + timedelta(days=randrange(30 * 365)) for _ in range(1000)]
+    scan = lambda a, b: sorted((f for f in catalog if f.start <= b and f.end >= a), key=lambda f: (f.start, f.end))
+    print(all(index.on(d) == scan(d, d) for d in days[:100]),
+          all(index.overlapping(d, d + timedelta(days=6)) == scan(d, d + timedelta(days=6)) for d in days[:100]))
+    print("what's on, scan: ", timeit(lambda: [scan(d, d) for d in days], number=1))
+    print("what's on, index:", timeit(lambda: [index.on(d) for d in days], number=1))
+    print('week, scan:      ', timeit(lambda: [scan(d, d + timedelta(days=6)) for d in days], number=1))
+    print('week, index:     ', timeit(lambda: [index.overlapping(d, d + timedelta(days=6)) for d in days], number=1))
+    print('remove 1000:     ', timeit(lambda: [index.remove(f) for f in catalog[:1000]], number=1))
+    print('insert 1000:     ', timeit(lambda: [index.insert(f) for f in catalog[:1000]], number=1))
+    print(len(index), all(set(map(id, index.on(d))) == set(map(id, scan(d, d))) for d in days[:100]))   # ties reordered
@@ -0,0 +1,224 @@
+"""Lazily decoded festivals: random access to the lineups of a festival JSON file by date
+"""
+
+
+from bisect import bisect_right
+from datetime import date
+import json
+import os
+
+from woodstock.music.festival import Festival
+from woodstock.music.lineup import Lineup
+from woodstock.music.serialization import JSONReader, build, build_performers
+from woodstock.util.dates import date_json_to_py
+
+
+# The offset index of a festival file is a JSON sidecar file next to it (<file>.index):
+#   {"size": ..., "mtime_ns": ...,                              # of the festival file, to detect changes
+#    "header": {"name": ..., "location": ..., "start": ..., "end": ...},
+#    "performers": [start, end] or null,                        # the performer table, if any (shared_performers)
+#    "lineups": [["1969-08-15", start, end, defined], ...]}     # in the order of the file
+# start and end are byte offsets in the festival file. With a performer table, defined is the number of performers
+# written in full in the lineups before this one (in a file streamed with dump(), see iter_json()), so that the
+# lineup that defines a performer id can be found without decoding the lineups in between.
+
+INDEX_SUFFIX = '.index'
+
+
+def index_festival_file(path):
+    """Scans the festival file at path (the flat JSON written by dumps()/dump(), with or without a performer table)
+    once, and returns its offset index (see above), without decoding the lineups into objects.
+    """
+
+    # latin-1: one character per byte, so that positions are byte offsets; newline='': no newline translation
+    with open(path, encoding='latin-1', newline='') as fp:
+        reader = JSONReader(fp)
+        header, performers, lineups = {}, None, []
+        defined = 0
+        for tag in reader.members():
+            if tag != "__Festival__":
+                raise ValueError(f'{path}: not a festival ({tag})')
+            for key in reader.members():
+                if key == 'performers':
+                    reader.value()
+                    performers = [reader.value_start, reader.tell()]
+                elif key == 'lineups':
+                    if reader.peek() != '[':
+                        raise ValueError(f'{path}: the lineups are not a JSON array (the nested format?)')
+                    for o in reader.elements():
+                        lineups.append([o["__Lineup__"]['date'], reader.value_start, reader.tell(), defined])
+                        if performers is not None:
+                            defined += sum(1 for p in o["__Lineup__"]['performers'] if type(p) is not int)
+                else:
+                    reader.value()
+                    header[key] = (reader.value_start, reader.tell())
+    with open(path, 'rb') as fp:                                # the header values, decoded from UTF-8 bytes
+        for key, (start, end) in header.items():
+            fp.seek(start)
+            header[key] = json.loads(fp.read(end - start))
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'header': header, 'performers': performers,
+            'lineups': lineups}
+
+
+def load_index(path):
+    """Returns the offset index of the festival file at path: from its sidecar file if it is up to date,
+    otherwise by scanning the festival file (and then saving the index in the sidecar file, if possible).
+    """
+
+    stat = os.stat(path)
+    index_path = str(path) + INDEX_SUFFIX
+    try:
+        with open(index_path) as fp:
+            index = json.load(fp)
+        if index['size'] == stat.st_size and index['mtime_ns'] == stat.st_mtime_ns:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    index = index_festival_file(path)
+    try:
+        with open(index_path, 'w') as fp:
+            json.dump(index, fp)
+    except OSError:                                             # e.g., a read-only directory: just not cached
+        pass
+    return index
+
+
+class LazyFestival(Festival):
+    """A festival whose lineups stay in its JSON file until they are used.
+    Opening the file (open()) reads only the offset index (see load_index()); lineup(d) decodes just the lineup
+    on date d, the first time it is asked for. Accessing lineups (and everything that uses it, e.g. __eq__(),
+    __str__() and fingerprint) decodes all the remaining lineups, after which the festival is a regular one.
+    """
+
+    def __init__(self, path, index):
+        header = index['header']
+        super().__init__(header['name'], header['location'],
+                         date_json_to_py(header['start']), date_json_to_py(header['end']))
+        self.path = path
+        self.__offsets = [(lineup[1], lineup[2]) for lineup in index['lineups']]
+        self.__dates = [date_json_to_py(lineup[0]) for lineup in index['lineups']]
+        self.__defined_before = [lineup[3] if len(lineup) > 3 else 0 for lineup in index['lineups']]
+        self.__by_date = {}                                     # date -> the position of its (first) lineup
+        for i, d in enumerate(self.__dates):
+            self.__by_date.setdefault(d, i)
+        self.__performers_offsets = index['performers']
+        self.__table = None                                     # the decoded performer table
+        self.__defined = {}                                     # position -> performers written in full in it
+        self.__decoded = {}                                     # position -> decoded lineup
+        self.__loaded = False                                   # all lineups decoded
+
+    @classmethod
+    def open(cls, path):
+        return cls(path, load_index(path))
+
+    @property
+    def dates(self):
+        """The dates of the lineups, in the order of the file (no lineups are decoded).
+        """
+
+        return list(self.__dates)
+
+    def lineup(self, d):
+        """Returns the lineup on date d (decoded and cached the first time). Raises KeyError if there is none.
+        """
+
+        return self.__lineup(self.__by_date[d])
+
+    def lineup_on(self, d):
+        return self.lineup(d)                                   # without decoding the other lineups
+
+    def __lineup(self, i):
+        lineup = self.__decoded.get(i)
+        if lineup is not None:
+            return lineup
+        if self.__performers_offsets is None:
+            lineup = self.__decoded[i] = build(json.loads(self.__read(*self.__offsets[i])))
+            return lineup
+        if self.__table is None:
+            self.__table = build_performers(json.loads(self.__read(*self.__performers_offsets)))
+        # The lineups that define the performers it refers to (written in full in them), and so on, are decoded
+        # with it, in file order, so that each of them finds the performers it refers to already decoded
+        pending, stack = {}, [i]
+        while stack:
+            j = stack.pop()
+            if j in pending or j in self.__decoded:
+                continue
+            fields = pending[j] = json.loads(self.__read(*self.__offsets[j]))["__Lineup__"]
+            stack.extend(self.__defining_lineup(p) for p in fields['performers']
+                         if type(p) is int and p >= len(self.__table))
+        for j in sorted(pending):
+            fields = pending[j]
+            performers = [self.__performer(p) if type(p) is int else build(p) for p in fields['performers']]
+            self.__defined[j] = [p for p, entry in zip(performers, fields['performers']) if type(entry) is not int]
+            self.__decoded[j] = Lineup(*performers, date=date_json_to_py(fields['date']))
+        return self.__decoded[i]
+
+    def __defining_lineup(self, k):
+        # The position of the lineup in which the performer with id k (not in the table) is written in full:
+        # the last one with at most k - len(table) performers defined before it
+        return bisect_right(self.__defined_before, k - len(self.__table)) - 1
+
+    def __performer(self, k):
+        if k < len(self.__table):
+            return self.__table[k]
+        i = self.__defining_lineup(k)
+        return self.__defined[i][k - len(self.__table) - self.__defined_before[i]]
+
+    def __read(self, start, end):
+        with open(self.path, 'rb') as fp:
+            fp.seek(start)
+            return fp.read(end - start)
+
+    @property
+    def lineups(self):
+        if not self.__loaded:
+            Festival.lineups.fset(self, [self.__lineup(i) for i in range(len(self.__offsets))])
+            self.__loaded = True
+        return Festival.lineups.fget(self)
+
+    @lineups.setter
+    def lineups(self, lineups):
+        Festival.lineups.fset(self, lineups)
+        self.__loaded = True
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    from datetime import timedelta
+    from pathlib import Path
+    import tempfile
+    from timeit import timeit
+
+    from woodstock.music.performer import Performer
+    from woodstock.music.serialization import dump, load
+
+    # A festival series of 300 lineups x 1000 performers, drawn from 3000 touring performers
+    start = date(1969, 8, 15)
+    touring = [Performer(f'Touring performer {i}', is_band=i % 2 == 0) for i in range(3000)]
+    tour = Festival('Tour', 'USA', start, start + timedelta(days=299),
+                    *[Lineup(*touring[i % 3 * 1000:(i % 3 + 1) * 1000], date=start + timedelta(days=i))
+                      for i in range(300)])
+    day = start + timedelta(days=150)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'tour.json'
+        for shared_performers in False, True:
+            with open(path, 'w') as fp:
+                dump(tour, fp, shared_performers=shared_performers)
+            print('shared' if shared_performers else 'flat')
+
+            def load_all():
+                with open(path) as fp:
+                    return load(fp)
+
+            print('load(), one lineup:                ', timeit(lambda: load_all().lineups[150], number=1))
+            print('open(), scan and index:            ', timeit(lambda: LazyFestival.open(path), number=1))
+            print('open(), sidecar index:             ', timeit(lambda: LazyFestival.open(path), number=1))
+            print('open(), sidecar index, one lineup: ', timeit(lambda: LazyFestival.open(path).lineup(day),
+                                                                number=1))
+            lazy = LazyFestival.open(path)
+            print(lazy.name, len(lazy.dates), lazy.lineup(day) == tour.lineups[150], lazy == tour)
+            Path(str(path) + INDEX_SUFFIX).unlink()
@@ -2,10 +2,14 @@
 """
 
 from datetime import date, datetime, time
+import hashlib
 import json
+import pickle
+import weakref
 
-from woodstock.music.performer import Performer, PerformerEncoder, performer_json_to_py
-from woodstock.util.utility import format_date
+from woodstock.music.performer import Performer, PerformerBase, PerformerEncoder, performer_json_to_py, \
+    unpickle_performer
+from woodstock.util.dates import format_date, parse_date, date_py_to_json, date_json_to_py
 
 
 class Lineup():
@@ -19,37 +23,118 @@ class Lineup():
     date_pattern = '%b %d, %Y'
 
     def __init__(self, *performers, date=date.today()):
-        self.performers = performers
-        self.date = date
-        self.__i = 0                                            # introduce and initialize iterator counter, self.__i
+        self.__performers = performers
+        self.__date = date
+        self.__fingerprint = None                               # (performer names, fingerprint)
+        self.__str = None                                       # str(self)
+        self.__owners = None                                    # id(festival) -> weak reference to the festival
+
+    # performers and date are properties, so that changing them invalidates the cached fingerprint, as does renaming
+    # one of the performers (see _performer_renamed()); a cache hit is then O(1). The date property is defined
+    # at the end of the class, not to shadow datetime.date in the class body.
+
+    @property
+    def performers(self):
+        return self.__performers
+
+    @performers.setter
+    def performers(self, performers):
+        self.__performers = tuple(performers)
+        self.__changed()
+
+    def __changed(self):
+        self.__fingerprint = self.__str = None
+        for festival in [ref() for ref in self.__owners.values()] if self.__owners else ():
+            if festival is not None:
+                festival._lineup_changed()
+
+    def _performer_renamed(self):
+        self.__changed()
+
+    def __names(self):
+        # The names of the performers, which the cached fingerprint and str(self) depend on besides the date;
+        # computing them attaches this lineup to its performers, so that renaming one of them resets the caches
+        names = []
+        for performer in self.__performers:
+            if isinstance(performer, PerformerBase):
+                performer._attach(self)
+                names.append(performer.name)
+            else:
+                names.append(str(performer))
+        return tuple(names)
+
+    @property
+    def fingerprint(self):
+        """64-bit content fingerprint of the lineup: a BLAKE2 hash of the date and the ordered performer names
+        (performer identity as in Performer.__eq__()). Stable across processes, so it can also be stored
+        and compared later to detect changes. Cached until the lineup is changed or one of its performers
+        is renamed.
+        """
+
+        cached = self.__fingerprint
+        if cached is None:
+            names = self.__names()
+            h = hashlib.blake2b(str(self.__date).encode(), digest_size=8)
+            for name in names:
+                h.update(b'\x00' + name.encode())
+            cached = self.__fingerprint = (names, int.from_bytes(h.digest(), 'big', signed=True))
+        return cached[1]
 
     def __str__(self):
         # return f'Lineup {self.date}: ' + \
-        #        ', '.join([performer.name for performer in self.performers if isinstance(performer, Performer)]) \
+        #        ', '.join([performer.name for performer in self.performers if isinstance(performer, PerformerBase)]) \
         #        if self.performers else f'Lineup {self.date}: not specified'
-        return f'Lineup for {format_date(self.date)}: ' + \
-               ', '.join([performer.name for performer in self.performers if isinstance(performer, Performer)]) \
-               if self.performers else f'Lineup for {format_date(self.date)}: not specified'
+        # Cached until the lineup is changed or one of its performers is renamed (see fingerprint)
+        if self.__str is None:
+            names = self.__names()                              # attaches the lineup to its performers
+            self.__str = f'Lineup for {format_date(self.date)}: ' + \
+                ', '.join([name for performer, name in zip(self.performers, names)
+                           if isinstance(performer, PerformerBase)]) \
+                if self.performers else f'Lineup for {format_date(self.date)}: not specified'
+        return self.__str
 
     def __eq__(self, other):
-        return self == other if isinstance(other, Lineup) else False
+        # Structural equality (date and ordered performer names). Different fingerprints decide it quickly;
+        # equal ones don't prove it (a 64-bit hash can collide), so then the names are compared one by one.
+        # (The old version, self == other, called __eq__() recursively and raised RecursionError.)
+        if not isinstance(other, Lineup):
+            return False
+        return self is other or (self.fingerprint == other.fingerprint and self.__date == other.date and
+                                 self.__fingerprint[0] == other.__fingerprint[0])
+
+    def __hash__(self):
+        return self.fingerprint                                 # don't change a lineup while it is in a set
+
+    def __reduce_ex__(self, protocol):
+        # Compact pickling: the performers and the date (as an ordinal); with protocol 5, large lineups of plain
+        # Performer objects are pickled as two columns (names and is_band), which can be transferred out-of-band
+        # (pickle.dumps(..., protocol=5, buffer_callback=...)) instead of being copied into the pickle
+        d = self.__date.toordinal() if type(self.__date) is date else self.__date
+        if protocol >= 5 and len(self.__performers) >= PICKLE_COLUMNS_MIN_SIZE:
+            columns = performer_columns(self.__performers)
+            if columns is not None:
+                return unpickle_lineup_columns, (*map(pickle.PickleBuffer, columns), d)
+        return unpickle_lineup, (self.__performers, d)
 
     # Alternative constructor 1
+    # (if registry, a PerformerRegistry, is specified, performers are taken from it as shared instances)
     @classmethod
-    def from_name_list(cls, names, date=date.today()):
-        performers = [Performer(performer) for performer in names if isinstance(performer, str)]
-        return cls(*performers, date=date)
+    def from_name_list(cls, names, date=date.today(), registry=None):
+        new_performer = registry.get if registry is not None else Performer
+        performers = (new_performer(performer) for performer in names if isinstance(performer, str))
+        return cls(*performers, date=date)                     # the generator is unpacked directly into a tuple
 
     # Alternative constructor 2
     @classmethod
-    def from_lineup_str(cls, lineup_str):
+    def from_lineup_str(cls, lineup_str, registry=None):
         if not lineup_str:
             return None
         split = lineup_str.split('Lineup for ')[1].split(': ')
         date_str = split[0]
         performer_names = split[1].split(', ')
-        performers = [Performer(performer) for performer in performer_names if isinstance(performer, str)]
-        return cls(*performers, date=datetime.strptime(date_str, Lineup.date_pattern))
+        new_performer = registry.get if registry is not None else Performer
+        performers = [new_performer(performer) for performer in performer_names if isinstance(performer, str)]
+        return cls(*performers, date=parse_date(date_str, Lineup.date_pattern))
 
     @staticmethod
     def is_date_valid(d):
@@ -61,15 +146,195 @@ class Lineup():
             return False
         return date(1967, 6, 1) < d < date.today()
 
+    # Set algebra over performers (hash-based, O(len(self) + len(other)); the order of self is preserved)
+    # Note that performers are compared as in Performer.__eq__(), i.e. mostly by name.
+
+    def union(self, other):
+        """Returns a new lineup (with self.date) of the performers in self or in other, without duplicates.
+        """
+
+        return Lineup(*dict.fromkeys(self.performers + tuple(other.performers)), date=self.date)
+
+    def intersection(self, other):
+        """Returns a new lineup (with self.date) of the performers in both self and other.
+        """
+
+        others = set(other.performers)
+        return Lineup(*dict.fromkeys(p for p in self.performers if p in others), date=self.date)
+
+    def difference(self, other):
+        """Returns a new lineup (with self.date) of the performers in self but not in other.
+        """
+
+        others = set(other.performers)
+        return Lineup(*dict.fromkeys(p for p in self.performers if p not in others), date=self.date)
+
+    # Iteration, indexing and sliced/paged views.
+    # __iter__() returns a new iterator each time (rather than self with an iterator counter in the lineup),
+    # so a lineup can be iterated many times, in nested loops and from many threads at the same time.
+
     def __iter__(self):
+        return iter(self.performers)
+
+    def __len__(self):
+        return len(self.performers)
+
+    def __bool__(self):
+        # A lineup is true even if it has no performers (as before __len__() was added), so that checks
+        # such as 'if lineup:' keep meaning 'if there is a lineup'
+        return True
+
+    def __getitem__(self, key):
+        """lineup[i] is the i-th performer; lineup[start:stop:step] is a LineupView (no copying of performers).
+        """
+
+        if isinstance(key, slice):
+            return LineupView(self, range(len(self.performers))[key])
+        return self.performers[key]
+
+    def page(self, n, size):
+        """Returns the n-th page (n = 1, 2,...) of performers, size performers per page, as a LineupView.
+        """
+
+        if n < 1 or size < 1:
+            raise ValueError(f'invalid page ({n}) or page size ({size})')
+        return self[(n - 1) * size:n * size]
+
+    @property
+    def date(self):
+        return self.__date
+
+    @date.setter
+    def date(self, date):
+        # The festivals this lineup is in validate the new date first; if one of them rejects it (the date is out of
+        # its range), the old date is restored and its exception (LineupDateException) is raised
+        festivals = [festival for festival in [ref() for ref in self.__owners.values()] if festival is not None] \
+            if self.__owners else []
+        old, self.__date = self.__date, date
+        for festival in festivals:
+            error = festival._check_lineup_date(self)
+            if error is not None:
+                self.__date = old
+                raise error
+        self.__changed()
+        for festival in festivals:
+            festival._lineup_date_changed(self, old)
+
+    # The festivals this lineup is in, which keep their lineups sorted by date (see Festival.lineup_on()), as weak
+    # references, so that a lineup doesn't keep a festival alive (the references to dead festivals are just skipped)
+
+    def _attach(self, festival):
+        if self.__owners is None:
+            self.__owners = {}
+        self.__owners[id(festival)] = weakref.ref(festival)
+
+    def _detach(self, festival):
+        if self.__owners:
+            self.__owners.pop(id(festival), None)
+
+
+PICKLE_COLUMNS_MIN_SIZE = 1000                                  # see Lineup.__reduce_ex__()
+
+
+def unpickle_lineup(performers, d):
+    return Lineup(*performers, date=date.fromordinal(d) if isinstance(d, int) else d)
+
+
+def performer_columns(performers):
+    """Returns (names, bands): the names of performers as UTF-8 bytes, separated by zero bytes, and is_band
+    of each one as a byte; or None if not all performers are plain Performer objects (just a name and is_band).
+    """
+
+    for p in performers:
+        if type(p) is not Performer or len(p.__dict__) != 2 or type(p.is_band) is not bool:
+            return None
+    names = '\x00'.join([p.name for p in performers])
+    if names.count('\x00') != len(performers) - 1:             # a zero byte in some name
+        return None
+    return names.encode(), bytes([p.is_band for p in performers])
+
+
+def unpickle_lineup_columns(names, bands, d):
+    names = str(names, 'utf-8').split('\x00')
+    return unpickle_lineup([unpickle_performer(Performer, name, is_band)
+                            for name, is_band in zip(names, map(bool, bytes(bands)))], d)
+
+
+class LineupView:
+    """Read-only view of a slice of a lineup's performers, created in O(1) time and without copying them.
+    Keeps the lineup and a range of indices; the performers are read from the lineup on access.
+    """
+
+    def __init__(self, lineup, indices):
+        self.lineup = lineup
+        self.indices = indices
+
+    @property
+    def date(self):
+        return self.lineup.date
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        return map(self.lineup.performers.__getitem__, self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return LineupView(self.lineup, self.indices[key])
+        return self.lineup.performers[self.indices[key]]
+
+    def __str__(self):
+        step = f':{self.indices.step}' if self.indices.step != 1 else ''
+        return f'Lineup for {format_date(self.date)} [{self.indices.start}:{self.indices.stop}{step}]: ' + \
+               ', '.join(performer.name for performer in self if isinstance(performer, PerformerBase))
+
+    def to_lineup(self):
+        """Returns a new Lineup with the performers in this view (this one copies them).
+        """
+
+        return Lineup(*self, date=self.date)
+
+
+class LineupBuilder:
+    """Mutable builder of a Lineup, for constructing large lineups from streams or one performer at a time.
+    Performers are collected in a list (amortized O(1) appends) and copied into the lineup's tuple exactly once,
+    in freeze(). The date is validated once, when the builder is created.
+    """
+
+    def __init__(self, date, performers=()):
+        if not Lineup.is_date_valid(date):
+            raise ValueError(f'invalid lineup date: {format_date(date)}')
+        self.date = date
+        self.__performers = list(performers)
+
+    def append(self, performer):
+        self.__performers.append(performer)
+        return self
+
+    def extend(self, performers):
+        """Appends all performers from an iterable, including generators (consumed lazily, without a copy).
+        """
+
+        self.__performers.extend(performers)
+        return self
+
+    def extend_names(self, names, registry=None):
+        """Appends a Performer for each name (a shared one, if registry, a PerformerRegistry, is specified).
+        """
+
+        new_performer = registry.get if registry is not None else Performer
+        self.__performers.extend(new_performer(name) for name in names if isinstance(name, str))
         return self
 
-    def __next__(self):
-        if self.__i < len(self.performers):
-            self.__i += 1
-            return self.performers[self.__i - 1]
-        else:
-            raise StopIteration
+    def __len__(self):
+        return len(self.__performers)
+
+    def freeze(self):
+        """Returns a new Lineup with the performers appended so far; the builder can still be used after that.
+        """
+
+        return Lineup(*self.__performers, date=self.date)      # f(*<list>) makes one tuple, passed on as is
 
 
 def next_performer(lineup):
@@ -108,9 +373,11 @@ class LineupEncoder(json.JSONEncoder):
 
     def default(self, o):
         if isinstance(o, Lineup):
-            d = o.__dict__.copy()
-            d['date'] = o.date.isoformat()
-            d['performers'] = json.dumps([p for p in o.performers], cls=PerformerEncoder, indent=4)
+            # d['performers'] = json.dumps([p for p in o.performers], cls=PerformerEncoder, indent=4)
+            # Joining the cached JSON fragments of the performers gives the same JSON (just not indented)
+            d = {'performers': '[' + ', '.join([p.json_fragment if isinstance(p, PerformerBase)
+                                                else json.dumps(p, cls=PerformerEncoder) for p in o.performers]) + ']',
+                 'date': date_py_to_json(o.date)}
             return {"__Lineup__": d}
         return {f"__{o.__class__.__name__}__": o.__dict__}
 
@@ -129,23 +396,12 @@ def lineup_json_to_py(lineup_json):
     # return lineup_json
 
     if "__Lineup__" in lineup_json:
-        lineup = Lineup()
-        lineup.__dict__.update(lineup_json["__Lineup__"])
-        # The next line returns a date object in spite of the compiler complaint
-        lineup.__dict__.update({'date': date.fromisoformat(lineup.date)})
-        # print(lineup.performers)
-        # print(type(lineup.performers))
-        # print(str(lineup.performers))
-        # lineup.__dict__.update({"performers": json.loads(str(lineup.performers), object_hook=performer_json_to_py)})
-        lineup.__dict__.update({'performers': tuple(json.loads(lineup.performers, object_hook=performer_json_to_py))})
-        # print(lineup.performers)
-        lineup.__dict__.update({'_Lineup__i': 0})
-        # # print(str(lineup.date))
-        # print(type(lineup.date))
-        # print(lineup.date)
-        # # lineup.date = datetime.fromisoformat(lineup.date.split('T')[0])
-        # # lineup.date = datetime.fromisoformat(lineup.date).date()
-        # lineup.date = datetime.fromisoformat(lineup.date)
+        d = lineup_json["__Lineup__"]
+        # performers and date are properties now, so the lineup cannot be patched through its __dict__
+        # lineup = Lineup()
+        # lineup.__dict__.update(lineup_json["__Lineup__"])
+        lineup = Lineup(*json.loads(d['performers'], object_hook=performer_json_to_py),
+                        date=date_json_to_py(d['date']))
         return lineup
     return lineup_json
 
@@ -206,7 +462,7 @@ if __name__ == "__main__":
     #     print(performer.name)
     # print()
     #
-    # # Repeated attempt to run the iterator fails, because the iterator is exhausted
+    # # Repeated iteration works as well, since each for loop gets a new iterator
     # for performer in day2_lineup:
     #     print(performer.name)
     # print()
@@ -242,9 +498,11 @@ if __name__ == "__main__":
     d2l = json.loads(day2_lineup_json, object_hook=lineup_json_to_py)
     print(d2l)
     print(day2_lineup)
-    # The following line causes # RecursionError: maximum recursion depth exceeded (???);
-    # see https://stackoverflow.com/questions/14749225/maximum-recursion-depth-exceeded-when-property-is-applied-to-instance-variab
-    # print(d2l == day2_lineup)
+    # The following line used to cause RecursionError: maximum recursion depth exceeded, since __eq__() was
+    # implemented as self == other; now it compares the cached fingerprints
+    print(d2l == day2_lineup, d2l.fingerprint == day2_lineup.fingerprint)
+    d2l.performers = d2l.performers[:-1]                        # invalidates the cached fingerprint
+    print(d2l == day2_lineup)
     print()
 
     # List of objects
@@ -255,6 +513,26 @@ if __name__ == "__main__":
     performers = [csny, jimiHendrix, theBand]
     day3_lineup = Lineup(*performers, date=date(1969, 8, 17))
 
+    # Sliced and paged views
+    print(day2_lineup[1:3])
+    print([p.name for p in day2_lineup.page(2, 3)])
+    print(day2_lineup[::2].to_lineup())
+    print([(p1.name, p2.name) for p1 in day3_lineup for p2 in day3_lineup if p1 != p2][:2])   # nested loops
+    print()
+
+    # Building a lineup from a stream of performers
+    builder = LineupBuilder(date(1969, 8, 18)).extend(p for p in performers if p.is_band)
+    builder.append(jimiHendrix).extend_names(['Sha Na Na', 'Paul Butterfield Blues Band'])
+    print(builder.freeze())
+    print()
+
+    # Set algebra over performers
+    tour_lineup = Lineup(theWho, jimiHendrix, melanie, date=date(1969, 8, 30))
+    print(day2_lineup.intersection(tour_lineup))
+    print(day2_lineup.union(day3_lineup))
+    print(day2_lineup.difference(tour_lineup))
+    print()
+
     lineups = [day1_lineup, day2_lineup, day3_lineup]
     lineups_json = json.dumps(lineups, cls=LineupEncoder, indent=4)
     print(lineups_json)
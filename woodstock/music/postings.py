@@ -0,0 +1,280 @@
+"""Inverted index of a catalog of festivals: from performers to the festivals and dates they play on
+"""
+
+
+from itertools import count
+import json
+import os
+
+from woodstock.music.performer import Performer, PerformerBase
+from woodstock.util.dates import date_py_to_json, date_json_to_py
+
+
+# Performer identity is the name (as in Performer.__eq__()), so the index works with any equal performer object
+# (e.g., one decoded from JSON) and can be saved as plain JSON. Each indexed lineup gets an integer id (a festival
+# can have several lineups on the same date, so (festival name, date) doesn't identify a lineup). For each performer
+# name, the postings are the ids of the lineups it plays in; for each lineup, the names are aligned with
+# lineup.performers (None for entries that are not performers), and its fingerprint (Lineup.fingerprint) tells whether
+# it has changed. The name -> (first) position map of a lineup is built from its names when it is first queried.
+# The index of a catalog file is saved in a sidecar file next to it (<file>.postings):
+#   {"lineups": [[id, "Woodstock", "1969-08-15", fingerprint, ["Richie Havens", null, ...]], ...],
+#    "festivals": {"Woodstock": [id, ...], ...}, "postings": {"Richie Havens": [id, ...], ...}}
+# i.e., the index structures themselves, so loading it doesn't recompute anything.
+
+POSTINGS_SUFFIX = '.postings'
+
+
+def postings_path(catalog_path):
+    """Returns the path of the sidecar file of the inverted index of the catalog file at catalog_path.
+    """
+
+    return str(catalog_path) + POSTINGS_SUFFIX
+
+
+class LineupIndex:
+    """Inverted index from performers to the lineups (festival name, date) they play in, with a name -> position
+    map per lineup. Adding or removing a lineup updates only the postings of its own performers,
+    and sync() re-indexes only the lineups that are new or have changed since the index was built or loaded.
+    """
+
+    def __init__(self):
+        self.__postings = {}                            # name -> {lineup id, ...}
+        self.__names = {}                               # lineup id -> [name or None, ...]
+        self.__positions = {}                           # lineup id -> {name: position}, built on demand
+        self.__lineups = {}                             # lineup id -> (festival name, date, fingerprint)
+        self.__festivals = {}                           # festival name -> [lineup id, ...], in lineup order
+        self.__ids = count()
+
+    def __len__(self):
+        return len(self.__lineups)
+
+    def __contains__(self, performer):
+        name = performer.name if isinstance(performer, PerformerBase) else performer
+        return name in self.__postings
+
+    # Incremental maintenance
+
+    def add_lineup(self, festival_name, lineup):
+        """Adds the lineup of the festival called festival_name, after its lineups that are already indexed.
+        """
+
+        self.__festivals.setdefault(festival_name, []).append(self.__add(festival_name, lineup))
+
+    def __add(self, festival_name, lineup):
+        lineup_id = next(self.__ids)
+        names = [performer.name if isinstance(performer, PerformerBase) else None for performer in lineup.performers]
+        for name in names:
+            if name is not None:
+                self.__postings.setdefault(name, set()).add(lineup_id)
+        self.__names[lineup_id] = names
+        self.__lineups[lineup_id] = (festival_name, lineup.date, lineup.fingerprint)
+        return lineup_id
+
+    def __remove(self, lineup_id):
+        for name in self.__names.pop(lineup_id):
+            lineup_ids = self.__postings.get(name)
+            if lineup_ids is not None:
+                lineup_ids.discard(lineup_id)
+                if not lineup_ids:
+                    del self.__postings[name]
+        self.__positions.pop(lineup_id, None)
+        del self.__lineups[lineup_id]
+
+    def remove_lineup(self, festival_name, d):
+        """Removes the lineups on date d of the festival called festival_name; does nothing if none are indexed.
+        """
+
+        lineup_ids = []
+        for lineup_id in self.__festivals.get(festival_name, ()):
+            if self.__lineups[lineup_id][1] == d:
+                self.__remove(lineup_id)
+            else:
+                lineup_ids.append(lineup_id)
+        if lineup_ids:
+            self.__festivals[festival_name] = lineup_ids
+        else:
+            self.__festivals.pop(festival_name, None)
+
+    def add_festival(self, festival):
+        for lineup in festival.lineups if isinstance(festival.lineups, tuple) else ():
+            self.add_lineup(festival.name, lineup)
+
+    def remove_festival(self, festival_name):
+        for lineup_id in self.__festivals.pop(festival_name, ()):
+            self.__remove(lineup_id)
+
+    def sync(self, festivals):
+        """Brings the index up to date with festivals (the whole catalog): adds the lineups that are new or have
+        changed (by their fingerprints) and removes those that are no longer in the catalog.
+        Returns the number of lineups added and removed.
+        """
+
+        stale = set(self.__festivals)
+        changes = 0
+        for festival in festivals:
+            stale.discard(festival.name)
+            # Indexed lineups are reused by fingerprint, wherever they are now in the festival
+            unchanged = {}
+            for lineup_id in self.__festivals.pop(festival.name, ()):
+                unchanged.setdefault(self.__lineups[lineup_id][2], []).append(lineup_id)
+            lineup_ids = []
+            for lineup in festival.lineups if isinstance(festival.lineups, tuple) else ():
+                reused = unchanged.get(lineup.fingerprint)
+                if reused:
+                    lineup_ids.append(reused.pop(0))
+                else:
+                    lineup_ids.append(self.__add(festival.name, lineup))
+                    changes += 1
+            for removed in unchanged.values():
+                for lineup_id in removed:
+                    self.__remove(lineup_id)
+                    changes += 1
+            if lineup_ids:
+                self.__festivals[festival.name] = lineup_ids
+        for festival_name in stale:
+            changes += len(self.__festivals[festival_name])
+            self.remove_festival(festival_name)
+        return changes
+
+    # Queries
+
+    def postings(self, performer):
+        """Returns the (festival name, date) of all lineups performer (a Performer or a name) plays in,
+        sorted by date (once per lineup, so a festival's date can occur more than once).
+        """
+
+        name = performer.name if isinstance(performer, PerformerBase) else performer
+        return sorted([self.__lineups[lineup_id][:2] for lineup_id in self.__postings.get(name, ())],
+                      key=lambda key: (key[1], key[0]))
+
+    def dates(self, performer):
+        return sorted({d for festival_name, d in self.postings(performer)})
+
+    def festivals(self, performer):
+        return sorted({festival_name for festival_name, d in self.postings(performer)})
+
+    def position(self, performer, festival_name, d):
+        """Returns the position of performer in the lineup on date d of the festival called festival_name
+        (in the first one it plays in, if there are several on d), or None if it doesn't play on d.
+        Raises KeyError if there is no lineup on d indexed.
+        """
+
+        name = performer.name if isinstance(performer, PerformerBase) else performer
+        lineup_ids = [lineup_id for lineup_id in self.__festivals.get(festival_name, ())
+                      if self.__lineups[lineup_id][1] == d]
+        if not lineup_ids:
+            raise KeyError((festival_name, d))
+        for lineup_id in lineup_ids:
+            positions = self.__positions.get(lineup_id)
+            if positions is None:
+                positions = self.__positions[lineup_id] = {}
+                for i, lineup_name in enumerate(self.__names[lineup_id]):
+                    if lineup_name is not None:
+                        positions.setdefault(lineup_name, i)
+            position = positions.get(name)
+            if position is not None:
+                return position
+        return None
+
+    # Persistence
+
+    def save(self, path):
+        lineups = [[lineup_id, festival_name, date_py_to_json(d), fingerprint, self.__names[lineup_id]]
+                   for lineup_id, (festival_name, d, fingerprint) in self.__lineups.items()]
+        postings = {name: list(lineup_ids) for name, lineup_ids in self.__postings.items()}
+        with open(path, 'w') as fp:
+            json.dump({'lineups': lineups, 'festivals': self.__festivals, 'postings': postings}, fp)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path) as fp:
+            saved = json.load(fp)
+        for lineup_id, festival_name, d, fingerprint, names in saved['lineups']:
+            index.__lineups[lineup_id] = (festival_name, date_json_to_py(d), fingerprint)
+            index.__names[lineup_id] = names
+        index.__festivals = saved['festivals']
+        index.__postings = {name: set(lineup_ids) for name, lineup_ids in saved['postings'].items()}
+        index.__ids = count(max(index.__lineups, default=-1) + 1)
+        return index
+
+    @classmethod
+    def open(cls, catalog_path, festivals=None):
+        """Returns the index of the catalog file at catalog_path, loaded from its sidecar file (an empty index if
+        there is none or it is unreadable). If festivals (the catalog) are specified, the index is synced with them
+        and, if anything has changed, saved back to the sidecar file.
+        """
+
+        path = postings_path(catalog_path)
+        try:
+            index = cls.load(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            index = cls()
+        if festivals is not None and (index.sync(festivals) or not os.path.exists(path)):
+            index.save(path)
+        return index
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    from datetime import date, timedelta
+    from pathlib import Path
+    from random import seed, randrange
+    from tempfile import TemporaryDirectory
+    from timeit import timeit
+
+    from woodstock.music.festival import Festival
+    from woodstock.music.lineup import Lineup
+
+    # Data
+    jimiHendrix = Performer('Jimi Hendrix', is_band=False)
+    theWho = Performer('The Who')
+    day1 = Lineup(Performer('Richie Havens', is_band=False), jimiHendrix, date=date(1969, 8, 15))
+    day2 = Lineup(theWho, Performer('Jefferson Airplane'), date=date(1969, 8, 16))
+    day3 = Lineup(Performer('Joe Cocker', is_band=False), jimiHendrix, date=date(1969, 8, 17))
+    woodstock = Festival('Woodstock', 'Bethel (NY)', date(1969, 8, 15), date(1969, 8, 17), day1, day2, day3)
+    monterey = Festival('Monterey Pop', 'Monterey (CA)', date(1967, 6, 16), date(1967, 6, 18),
+                        Lineup(theWho, jimiHendrix, date=date(1967, 6, 18)))
+
+    index = LineupIndex()
+    index.add_festival(woodstock)
+    index.add_festival(monterey)
+    print(index.postings(jimiHendrix))
+    print(index.festivals('The Who'), index.dates('The Who'))
+    print(index.position(jimiHendrix, 'Woodstock', date(1969, 8, 17)))
+    index.remove_lineup('Woodstock', date(1969, 8, 17))
+    print(index.postings(jimiHendrix))
+    index.remove_festival('Monterey Pop')
+    print(index.postings(jimiHendrix), 'The Who' in index)
+    woodstock.add_lineup(Lineup('(rain delay)', Performer('Santana'), jimiHendrix, date=date(1969, 8, 16)))
+    index.sync([woodstock])
+    print(index.postings(jimiHendrix), index.position(jimiHendrix, 'Woodstock', date(1969, 8, 16)))
+    print()
+
+    # A catalog of 20 festivals x 30 lineups x 1000 performers, drawn from 5000 performers:
+    # a full scan vs. the index; building the index vs. loading it from its sidecar file and syncing it
+    seed(1969)
+    performers = [Performer(f'Performer {i}', is_band=i % 2 == 0) for i in range(5000)]
+    catalog = []
+    for year in range(1969, 1989):
+        start = date(year, 7, 1)
+        catalog.append(Festival(f'Woodstock {year}', 'Bethel (NY)', start, start + timedelta(days=29),
+                                *[Lineup(*performers[randrange(4000):][:1000], date=start + timedelta(days=i))
+                                  for i in range(30)]))
+    who = performers[2500]
+    scan = lambda: sorted(((f.name, l.date) for f in catalog for l in f.lineups if who in l.performers),
+                          key=lambda key: (key[1], key[0]))
+    index = LineupIndex()
+    print('build:', timeit(lambda: [index.add_festival(f) for f in catalog], number=1))
+    print(scan() == index.postings(who))
+    print('scan: ', timeit(scan, number=10) / 10)
+    print('index:', timeit(lambda: index.postings(who), number=10) / 10)
+    with TemporaryDirectory() as tmp:
+        catalog_path = Path(tmp) / 'catalog.snapshot'
+        print('open (new):     ', timeit(lambda: LineupIndex.open(catalog_path, catalog), number=1))
+        print('open (saved):   ', timeit(lambda: LineupIndex.open(catalog_path), number=1))
+        catalog[3].lineups[5].performers = performers[:10]
+        print('open (1 change):', timeit(lambda: LineupIndex.open(catalog_path, catalog), number=1))
+        print(LineupIndex.open(catalog_path).postings(performers[0])[:2])
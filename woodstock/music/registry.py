@@ -0,0 +1,95 @@
+"""Flyweight registry of Performer objects
+"""
+
+
+import sys
+import weakref
+
+from woodstock.music.performer import Performer
+
+
+class PerformerRegistry:
+    """Opt-in flyweight registry that interns performers: for each (class, name, is_band) key,
+    there is at most one shared Performer instance.
+    Name strings are interned with sys.intern(), so equal names are also the same str object
+    (which makes comparing them in Performer.__eq__() an identity check).
+    Instances are held through weak references, so a performer that is not used anywhere else
+    is evicted from the registry automatically.
+
+    Shared instances must be treated as immutable: renaming one of them (<performer>.name = ...)
+    renames it in every lineup that uses it, and leaves it registered under the old key.
+
+    Usage:
+        registry = PerformerRegistry()
+        lineup = Lineup.from_name_list(names, registry=registry)
+        performers = json.loads(s, object_hook=functools.partial(performer_json_to_py, registry=registry))
+    """
+
+    def __init__(self):
+        self.__performers = weakref.WeakValueDictionary()      # key -> performer
+        self.__ids = weakref.WeakValueDictionary()             # id(performer) -> performer, for __contains__()
+
+    def get(self, name, is_band=True, cls=Performer, **kwargs):
+        """Returns the shared instance of cls for name and is_band, creating it if necessary.
+        Any other constructor arguments (e.g., vocals for Singer) are passed as kwargs and become part of the key.
+        """
+
+        # The name as the constructor (the name setter) normalizes it, so that, e.g., '' and None
+        # give the same 'unknown' performer
+        name = sys.intern(name) if name and isinstance(name, str) else 'unknown'
+        key = (cls, name, is_band, *sorted(kwargs.items())) if kwargs else (cls, name, is_band)
+        performer = self.__performers.get(key)
+        if performer is None:
+            performer = cls(name=name, is_band=is_band, **kwargs)
+            self.__performers[key] = performer
+            self.__ids[id(performer)] = performer
+        return performer
+
+    def __len__(self):
+        return len(self.__performers)
+
+    def __contains__(self, performer):
+        # By identity (an equal performer that is not the shared instance is not in the registry);
+        # an entry is removed when its performer is garbage collected, before its id can be reused
+        return self.__ids.get(id(performer)) is performer
+
+    def clear(self):
+        self.__performers.clear()
+        self.__ids.clear()
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    import json
+    from functools import partial
+    from woodstock.music.lineup import Lineup
+    from woodstock.music.performer import PerformerEncoder, performer_json_to_py, SlottedPerformer
+    from woodstock.util import utility
+
+    registry = PerformerRegistry()
+
+    # The same performer in many lineups is a single object
+    names = ['Grateful Dead', 'Jefferson Airplane', 'The Who', 'Creedence Clearwater Revival']
+    lineups = [Lineup.from_name_list(names, registry=registry) for _ in range(500)]
+    print(len(registry), all(lineup.performers[0] is lineups[0].performers[0] for lineup in lineups))
+    print(Performer.from_str('The Who (band)', registry=registry) is lineups[0].performers[2])
+    print(registry.get('The Who', cls=SlottedPerformer) is lineups[0].performers[2])   # different class, other key
+    print(registry.get('') is registry.get(None), lineups[0].performers[2] in registry, Performer('The Who') in registry)
+    print()
+
+    # JSON decoding through the registry
+    performers_json = json.dumps([Performer(name, is_band=True) for name in names] * 1000, cls=PerformerEncoder)
+    performers = json.loads(performers_json, object_hook=partial(performer_json_to_py, registry=registry))
+    print(len(performers), len({id(p) for p in performers}))
+    print()
+
+    # Unused performers are evicted
+    del lineups, performers
+    print(len(registry))
+    print()
+
+    # Memory of 1000 lineups x 4 performers, with and without the registry (bytes per lineup)
+    print(utility.measure_memory(lambda i: Lineup.from_name_list(names), n=1000))
+    print(utility.measure_memory(lambda i: Lineup.from_name_list(names, registry=registry), n=1000))
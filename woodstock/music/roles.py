@@ -0,0 +1,173 @@
+"""Role index over a catalog of performers: role and date queries as bitmask intersections
+"""
+
+
+from array import array
+import re
+
+from woodstock.music.enums import Role
+from woodstock.music.performer import Performer, PerformerBase
+
+
+def performer_roles(performer):
+    """Returns the roles of a performer as Role flags, derived from its vocals, instrument and writes_songs.
+    """
+
+    roles = Role.of(getattr(performer, 'vocals', None)) | Role.of(getattr(performer, 'instrument', None))
+    return roles | Role.SONGWRITER if getattr(performer, 'writes_songs', False) else roles
+
+
+def _set_bit(bitset, i):
+    if len(bitset) <= i >> 3:
+        bitset.extend(bytes((i >> 3) + 1 - len(bitset)))
+    bitset[i >> 3] |= 1 << (i & 7)
+
+
+class RoleIndex:
+    """Index of the roles and the performance dates of the performers in a catalog.
+    Each distinct performer (as in Performer.__eq__()) is a row; for each Role flag and for each date, there is
+    a bitset of the rows with that role or performing on that date. A query such as 'lead vocalists who also
+    play bass, performing on Aug 16' is the intersection (AND) of three bitsets, computed with big-int operations
+    over all rows at once, rather than an isinstance() check and attribute scans per performer.
+    The roles of a performer are the union of all roles it has been added with, so multi-instrument players
+    are supported: index.add(performer, roles=Role.LEAD_VOCALS | Role.BASS).
+    """
+
+    def __init__(self):
+        self.__rows = {}                                # performer -> row
+        self.__performers = []                          # row -> performer
+        self.__roles = array('H')                       # row -> Role flags
+        self.__role_bits = {role: bytearray() for role in Role if role}
+        self.__date_bits = {}                           # date -> bitset of rows
+
+    def __len__(self):
+        return len(self.__performers)
+
+    def add(self, performer, roles=None, dates=()):
+        """Adds a performer with its roles (performer_roles(performer) by default) and performance dates,
+        or adds more roles and dates to a performer that is already in the index.
+        """
+
+        row = self.__rows.get(performer)
+        if row is None:
+            row = self.__rows[performer] = len(self.__performers)
+            self.__performers.append(performer)
+            self.__roles.append(0)
+        roles = performer_roles(performer) if roles is None else roles
+        self.__roles[row] |= roles
+        for role, bitset in self.__role_bits.items():
+            if roles & role:
+                _set_bit(bitset, row)
+        for d in dates:
+            _set_bit(self.__date_bits.setdefault(d, bytearray()), row)
+        return row
+
+    def add_lineup(self, lineup, roles=None):
+        """Adds all performers of a lineup, performing on lineup.date.
+        roles, if specified, is a dict: performer -> Role flags, for performers with roles other than the default.
+        """
+
+        for performer in lineup.performers:
+            if isinstance(performer, PerformerBase):
+                self.add(performer, roles.get(performer) if roles else None, (lineup.date,))
+
+    def add_festival(self, festival, roles=None):
+        for lineup in festival.lineups:
+            self.add_lineup(lineup, roles)
+
+    def roles(self, performer):
+        """Returns the Role flags of a performer in the index (Role.NONE if it is not in the index).
+        """
+
+        row = self.__rows.get(performer)
+        return Role.NONE if row is None else Role(self.__roles[row])
+
+    def query(self, roles=Role.NONE, on=None, any_roles=Role.NONE):
+        """Returns the performers that have all the roles in roles, at least one of the roles in any_roles
+        (if specified) and perform on the date on (if specified), in the order they were added to the index.
+        E.g., index.query(Role.LEAD_VOCALS | Role.BASS, on=date(1969, 8, 16))
+        """
+
+        n = len(self.__performers)
+        mask = (1 << n) - 1
+        for role in Role:
+            if role and roles & role:
+                mask &= int.from_bytes(self.__role_bits[role], 'little')
+        if any_roles:
+            mask &= self.__union(self.__role_bits[role] for role in Role if role and any_roles & role)
+        if on is not None:
+            mask &= int.from_bytes(self.__date_bits.get(on, b''), 'little')
+        return [self.__performers[i] for i in self.__rows_in(mask, n)]
+
+    @staticmethod
+    def __union(bitsets):
+        result = 0
+        for bitset in bitsets:
+            result |= int.from_bytes(bitset, 'little')
+        return result
+
+    @staticmethod
+    def __rows_in(mask, n):
+        """Generates the indices of the bits set in mask (n bits), scanning only its non-zero bytes.
+        """
+
+        bits = mask.to_bytes((n + 7) >> 3, 'little')
+        for m in re.finditer(b'[^\x00]', bits):
+            byte, base = bits[m.start()], m.start() << 3
+            for k in range(8):
+                if byte >> k & 1:
+                    yield base + k
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    from datetime import date
+    from random import seed, random, choice, sample
+    from timeit import timeit
+
+    from woodstock.music.enums import Vocals, Instrumet
+    from woodstock.music.lineup import Lineup
+    from woodstock.music.performer import Singer, Songwriter, SingerSongwriter
+
+    # Data
+    rogerDaltrey = Singer(name='Roger Daltrey', vocals=Vocals.LEAD_VOCALS)
+    peteTownshend = SingerSongwriter(name='Pete Townshend', vocals=Vocals.BACKGROUND_VOCALS,
+                                     instrument=Instrumet.LEAD_GUITAR)
+    johnEntwistle = Songwriter(name='John Entwistle', instrument=Instrumet.BASS)
+    jackCasady = Performer('Jack Casady', is_band=False)
+    graceSlick = Singer(name='Grace Slick', vocals=Vocals.LEAD_VOCALS)
+    jimiHendrix = SingerSongwriter(name='Jimi Hendrix', vocals=Vocals.LEAD_VOCALS, instrument=Instrumet.LEAD_GUITAR)
+    day2_lineup = Lineup(rogerDaltrey, peteTownshend, johnEntwistle, graceSlick, jackCasady, date=date(1969, 8, 16))
+    day3_lineup = Lineup(jimiHendrix, date=date(1969, 8, 17))
+
+    print(repr(Role.of(Vocals.LEAD_VOCALS)), repr(performer_roles(peteTownshend)))
+    index = RoleIndex()
+    index.add_lineup(day2_lineup, roles={jackCasady: Role.BASS, johnEntwistle: Role.BASS | Role.BACKGROUND_VOCALS})
+    index.add_lineup(day3_lineup)
+    index.add(jimiHendrix, roles=Role.BASS)                     # multi-instrument player
+    print(repr(index.roles(jimiHendrix)))
+    print([p.name for p in index.query(Role.LEAD_VOCALS)])
+    print([p.name for p in index.query(Role.LEAD_VOCALS | Role.BASS)])
+    print([p.name for p in index.query(Role.LEAD_VOCALS | Role.BASS, on=date(1969, 8, 16))])
+    print([p.name for p in index.query(Role.BASS, on=date(1969, 8, 16))])
+    print([p.name for p in index.query(any_roles=Role.LEAD_GUITAR | Role.BASS, on=date(1969, 8, 17))])
+    print()
+
+    # 1,000,000 performers, 100 dates: index query vs. attribute scan
+    seed(1969)
+    dates = [date(1969, 8, 15 + i % 4).replace(year=1969 + i // 4) for i in range(100)]
+    performers = [SingerSongwriter(name=f'Performer {i}', vocals=choice(list(Vocals)),
+                                   instrument=choice(list(Instrumet))) for i in range(1_000_000)]
+    extra_roles = [Role.BASS if random() < 0.1 else Role.NONE for _ in performers]
+    performance_dates = [sample(dates, 2) for _ in performers]
+    index = RoleIndex()
+    for p, r, d in zip(performers, extra_roles, performance_dates):
+        index.add(p, roles=performer_roles(p) | r, dates=d)
+    on = dates[1]
+    print(timeit(lambda: [p for p, r, d in zip(performers, extra_roles, performance_dates)
+                          if isinstance(p, Singer) and p.vocals == Vocals.LEAD_VOCALS
+                          and (p.instrument == Instrumet.BASS or r & Role.BASS) and on in d], number=5) / 5)
+    print(timeit(lambda: index.query(Role.LEAD_VOCALS | Role.BASS, on=on), number=5) / 5)
+    print(len(index.query(Role.LEAD_VOCALS | Role.BASS, on=on)))
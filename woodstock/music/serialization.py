@@ -0,0 +1,775 @@
+"""Flat, single-pass JSON encoding and decoding of Performer, Lineup and Festival objects
+"""
+
+
+from collections.abc import Iterator
+from datetime import date
+from enum import Enum
+import json
+import re
+
+from woodstock.music.enums import Vocals, Instrumet
+from woodstock.music.festival import Festival
+from woodstock.music.lineup import Lineup
+from woodstock.music.performer import Performer, PerformerBase, PerformerEncoder, performer_fields
+from woodstock.util.dates import date_py_to_json, date_json_to_py
+
+
+# The flat format uses the same tags and fields as PerformerEncoder, LineupEncoder and FestivalEncoder,
+# but nested objects are nested JSON values rather than JSON strings (encoded with another json.dumps()), e.g.
+#   {"__Lineup__": {"performers": [{"__Performer__": {"_Performer__name": "The Who", "is_band": true}}],
+#                   "date": "1969-08-16"}}
+# instead of
+#   {"__Lineup__": {"performers": "[{\"__Performer__\": {\"_Performer__name\": \"The Who\", ...}}]", ...}}
+
+ENUMS = {cls.__name__: cls for cls in (Vocals, Instrumet)}
+
+
+def encode_performer(performer):
+    return {"__Performer__": performer_fields(performer)}
+
+
+def encode_lineup(lineup):
+    return {"__Lineup__": {'performers': list(lineup.performers), 'date': date_py_to_json(lineup.date)}}
+
+
+def encode_festival(festival):
+    return {"__Festival__": {'name': festival.name,
+                             'location': festival.location,
+                             'start': date_py_to_json(festival.start),
+                             'end': date_py_to_json(festival.end),
+                             'lineups': list(festival.lineups)}}
+
+
+# With shared_performers=True, each distinct performer is written once, in a performer table of the festival
+# (or of a list of lineups), and lineups refer to performers by their integer ids (positions in the table):
+#   {"__Festival__": {"name": ..., "performers": [{"__Performer__": ...}, ...],
+#                     "lineups": [{"__Lineup__": {"performers": [0, 5, 7], "date": "1969-08-16"}}, ...]}}
+#   {"__Lineups__": {"performers": [...], "lineups": [...]}}
+# Performers are distinct if their JSON is distinct (Performer.json_fragment).
+
+def performer_table(lineups):
+    """Returns (performers, ids): the list of distinct performers in lineups, and for each lineup,
+    the list of the ids (positions in performers) of its performers.
+    """
+
+    table = {}                                                  # JSON fragment -> (id, performer)
+    ids = []
+    for lineup in lineups:
+        lineup_ids = []
+        for p in lineup.performers:
+            key = performer_to_json(p)
+            entry = table.get(key)
+            if entry is None:
+                entry = table[key] = (len(table), p)
+            lineup_ids.append(entry[0])
+        ids.append(lineup_ids)
+    return [p for i, p in table.values()], ids
+
+
+def encode_lineups_shared(lineups):
+    performers, ids = performer_table(lineups)
+    return {'performers': performers,
+            'lineups': [{"__Lineup__": {'performers': i, 'date': date_py_to_json(l.date)}}
+                        for l, i in zip(lineups, ids)]}
+
+
+def encode_festival_shared(festival):
+    shared = encode_lineups_shared(festival.lineups)
+    return {"__Festival__": {'name': festival.name,
+                             'location': festival.location,
+                             'start': date_py_to_json(festival.start),
+                             'end': date_py_to_json(festival.end),
+                             'performers': shared['performers'],
+                             'lineups': shared['lineups']}}
+
+
+def is_lineup_list(o):
+    return isinstance(o, (list, tuple)) and o and all(isinstance(item, Lineup) for item in o)
+
+
+def encode_enum(member):
+    return {f"__{member.__class__.__name__}__": member.name}    # as in PerformerEncoder
+
+
+def dispatch(table, o):
+    """Returns the function for the class of o from a type-dispatch table, or None.
+    Subclasses and virtual subclasses of the classes in the table are resolved on first use and cached.
+    """
+
+    f = table.get(type(o))
+    if f is None:
+        for cls, g in list(table.items()):
+            if isinstance(o, cls):
+                f = table[type(o)] = g
+                break
+    return f
+
+
+class MusicEncoder(json.JSONEncoder):
+    """Single-pass JSON encoder for Performer, Lineup and Festival objects (and the enums they use).
+    Objects are converted to JSON-ready dicts by the functions in the type-dispatch table encoders,
+    and json.dumps() then encodes the whole structure in one pass.
+    """
+
+    encoders = {PerformerBase: encode_performer, Lineup: encode_lineup, Festival: encode_festival, Enum: encode_enum,
+                date: date_py_to_json}
+
+    def __init__(self, *args, shared_performers=False, **kwargs):
+        """With shared_performers=True, festivals are encoded with a performer table (see performer_table()).
+        For lists of lineups, wrap them first: json.dumps(LineupList(lineups), cls=MusicEncoder,...).
+        """
+
+        super().__init__(*args, **kwargs)
+        self.shared_performers = shared_performers
+
+    def default(self, o):
+        if self.shared_performers:
+            if isinstance(o, Festival):
+                return encode_festival_shared(o)
+            if isinstance(o, LineupList):
+                return {"__Lineups__": encode_lineups_shared(o)}
+        encoder = dispatch(self.encoders, o)
+        return encoder(o) if encoder is not None else super().default(o)     # super() raises TypeError
+
+
+class LineupList(list):
+    """A list of lineups to be encoded with a performer table (see MusicEncoder).
+    """
+
+    pass
+
+
+# The compact (non-indented) flat JSON can also be written directly, by concatenating the JSON of the parts;
+# that avoids calling MusicEncoder.default() for each performer, and reuses the cached Performer.json_fragment.
+# The output is the same as that of json.dumps(o, cls=MusicEncoder).
+
+def performer_to_json(performer):
+    if isinstance(performer, PerformerBase) and hasattr(performer, 'json_fragment'):
+        return performer.json_fragment
+    return json.dumps(performer, cls=MusicEncoder)
+
+
+# Streaming (see iter_json()) encodes the performers without their caches: the cached fragments of all
+# the performers of a huge festival would otherwise stay in memory after it has been written
+
+encode_performer_json = PerformerEncoder().encode
+
+
+def performer_to_json_uncached(performer):
+    # The same as performer_to_json(), without filling Performer.json_fragment (classes that override it,
+    # e.g. PerformerRow, don't cache it on the object)
+    if isinstance(performer, PerformerBase) and type(performer).json_fragment is PerformerBase.json_fragment:
+        return encode_performer_json({"__Performer__": performer_fields(performer)})
+    return performer_to_json(performer)
+
+
+def lineup_to_json(lineup):
+    return '{"__Lineup__": {"performers": [' + ', '.join([to_json(p) for p in lineup.performers]) + \
+        '], "date": "' + date_py_to_json(lineup.date) + '"}}'
+
+
+def festival_header_to_json(festival):
+    # The JSON of a festival up to its lineups (or its performer table), open, to be completed by the caller
+    return '{"__Festival__": {"name": ' + json.dumps(festival.name) + ', "location": ' + \
+        json.dumps(festival.location) + ', "start": "' + date_py_to_json(festival.start) + '", "end": "' + \
+        date_py_to_json(festival.end) + '"'
+
+
+def festival_to_json(festival):
+    return festival_header_to_json(festival) + ', "lineups": [' + \
+        ', '.join([to_json(l) for l in festival.lineups]) + ']}}'
+
+
+JSON_WRITERS = {PerformerBase: performer_to_json, Lineup: lineup_to_json, Festival: festival_to_json}
+
+
+def lineup_ids_to_json(lineup, ids):
+    return '{"__Lineup__": {"performers": [' + ', '.join(map(str, ids)) + '], "date": "' + \
+        date_py_to_json(lineup.date) + '"}}'
+
+
+def lineups_to_json_shared(lineups):
+    performers, ids = performer_table(lineups)
+    return '"performers": [' + ', '.join([performer_to_json(p) for p in performers]) + '], "lineups": [' + \
+        ', '.join([lineup_ids_to_json(l, i) for l, i in zip(lineups, ids)]) + ']'
+
+
+def festival_to_json_shared(festival):
+    return festival_header_to_json(festival) + ', ' + lineups_to_json_shared(festival.lineups) + '}}'
+
+
+def to_json(o, shared_performers=False):
+    """Returns the compact flat JSON of o (an object, or a list or tuple of objects).
+    With shared_performers=True, festivals and lists of lineups are written with a performer table.
+    """
+
+    if shared_performers:
+        if isinstance(o, Festival):
+            return festival_to_json_shared(o)
+        if is_lineup_list(o):
+            return '{"__Lineups__": {' + lineups_to_json_shared(o) + '}}'
+    writer = dispatch(JSON_WRITERS, o)
+    if writer is not None:
+        return writer(o)
+    if isinstance(o, (list, tuple)):
+        return '[' + ', '.join([to_json(item) for item in o]) + ']'
+    return json.dumps(o, cls=MusicEncoder)
+
+
+# Streaming: iter_json() yields the JSON of o in chunks of at most one performer or lineup each, and dump() writes
+# them to a file one by one, so that the whole JSON is never in memory at once. Without shared_performers, the JSON
+# is the same as to_json(). With shared_performers=True, a performer is written in full only the first time it
+# appears in a lineup, and then referred to by its id (the position in the order of first appearance), so that
+# ids can be assigned as the lineups are written; the performer table before the lineups is then empty:
+#   {"__Lineups__": {"performers": [], "lineups": [
+#       {"__Lineup__": {"performers": [{"__Performer__": ...}, {"__Performer__": ...}], "date": "1969-08-15"}},
+#       {"__Lineup__": {"performers": [1, {"__Performer__": ...}, 0], "date": "1969-08-16"}}]}}
+# Only the ids of the distinct performers are kept while writing (not the lineups, or a table of the performers).
+# With lines=True, dump() writes newline-delimited JSON instead, one object per line, so that a reader
+# can process each line as soon as it is written (see load_lines()). A festival is written as its header
+# (the festival with no lineups, "lineups": []), followed by its lineups, with performer ids as above
+# if shared_performers=True as well.
+
+def iter_json(o, shared_performers=False):
+    """Yields the compact flat JSON of o in chunks (see above). o can also be an iterator of objects,
+    e.g. a generator of lineups, which is written as a list (with shared_performers=True, its items must
+    be lineups). The caches of the performers (Performer.json_fragment) are not used or filled.
+    """
+
+    if isinstance(o, Festival):
+        yield festival_header_to_json(o) + ', '
+        yield from iter_lineups_json(o.lineups, {} if shared_performers else None)
+        yield '}}'
+    elif shared_performers and (is_lineup_list(o) or isinstance(o, Iterator)):
+        yield '{"__Lineups__": {'
+        yield from iter_lineups_json(o, {})
+        yield '}}'
+    elif isinstance(o, (list, tuple, Iterator)):
+        yield '['
+        for i, item in enumerate(o):
+            if i:
+                yield ', '
+            yield from iter_json(item)
+        yield ']'
+    elif isinstance(o, Lineup):
+        yield lineup_to_json_inline(o)
+    else:
+        yield performer_to_json_uncached(o)                     # a performer, or any other value
+
+
+def iter_lineups_json(lineups, ids=None):
+    if ids is not None:
+        yield '"performers": [], '
+    yield '"lineups": ['
+    for i, lineup in enumerate(lineups):
+        if not isinstance(lineup, Lineup):
+            raise TypeError(f'Not a lineup, with shared performers: {lineup!r}')
+        yield (', ' if i else '') + lineup_to_json_inline(lineup, ids)
+    yield ']'
+
+
+def lineup_to_json_inline(lineup, ids=None):
+    """Returns the JSON of lineup for streaming, without the caches of its performers. With ids (JSON fragment
+    -> id), for shared performers: the performers already in ids are written as their ids, and the others
+    in full (and added to ids).
+    """
+
+    parts = []
+    for p in lineup.performers:
+        fragment = performer_to_json_uncached(p)
+        if ids is not None:
+            i = ids.get(fragment)
+            if i is None:
+                ids[fragment] = len(ids)
+            else:
+                fragment = str(i)
+        parts.append(fragment)
+    return '{"__Lineup__": {"performers": [' + ', '.join(parts) + '], "date": "' + date_py_to_json(lineup.date) + '"}}'
+
+
+def dump(o, fp, shared_performers=False, lines=False):
+    """Writes the compact flat JSON of o to the text file fp, one performer or lineup at a time (see iter_json()).
+    With lines=True, writes newline-delimited JSON: the header of a festival and then its lineups,
+    or the items of a list (or an iterator), or just o, one per line.
+    Memory use doesn't grow with the output, only with the number of distinct performers if shared_performers=True.
+    """
+
+    write = fp.write                                            # text files are buffered (io.TextIOWrapper)
+    if not lines:
+        for chunk in iter_json(o, shared_performers):
+            write(chunk)
+        return
+    ids = {} if shared_performers else None
+    if isinstance(o, Festival):
+        write(festival_header_to_json(o) + ', "lineups": []}}\n')
+        o = o.lineups
+    for item in o if isinstance(o, (list, tuple, Iterator)) else (o,):
+        write((lineup_to_json_inline(item, ids) if isinstance(item, Lineup) else ''.join(iter_json(item))) + '\n')
+
+
+def decode_performer(fields):
+    # Built directly from the decoded fields (Performer._from_fields()), without calling __init__()
+    if '_Performer__name' not in fields:                        # not written by an encoder from this package
+        fields = {'_Performer__name': 'unknown', 'is_band': True, **fields}     # as in Performer("")
+    return performer_from_fields(fields)
+
+
+performer_from_fields = Performer._from_fields
+
+
+def decode_lineup(fields):
+    performers = fields['performers']
+    if isinstance(performers, str):                             # the nested format of LineupEncoder
+        performers = json.loads(performers, object_hook=music_json_to_py)
+    elif any(type(p) is int for p in performers):               # ids in a performer table, decoded later
+        return None
+    return Lineup(*performers, date=date_json_to_py(fields['date']))
+
+
+def resolve_performers(performers, table, decode):
+    """Returns the performers of a lineup encoded with a performer table: the ids refer to table, and the other
+    entries are performers written in full (streamed, see iter_json()), which are decoded and added to table.
+    """
+
+    resolved = []
+    for p in performers:
+        if type(p) is int:
+            resolved.append(table[p])
+        else:
+            p = decode(p)
+            table.append(p)
+            resolved.append(p)
+    return resolved
+
+
+def decode_shared_lineups(fields, decode=lambda p: p):
+    """Decodes the lineups of a festival or a list of lineups encoded with a performer table; all references
+    to the same performer id become the same (shared) Performer object. The performers written in full
+    in the lineups are decoded with decode (if they are not already decoded).
+    """
+
+    table = fields['performers']
+    lineups = []
+    for l in fields['lineups']:
+        if isinstance(l, Lineup):                               # no ids: all its performers written in full
+            table.extend(l.performers)
+        elif isinstance(l, dict) and "__Lineup__" in l:
+            l = Lineup(*resolve_performers(l["__Lineup__"]['performers'], table, decode),
+                       date=date_json_to_py(l["__Lineup__"]['date']))
+        lineups.append(l)
+    return lineups
+
+
+def decode_festival(fields):
+    lineups = fields['lineups']
+    if isinstance(lineups, str):                                # the nested format of FestivalEncoder
+        lineups = json.loads(lineups, object_hook=music_json_to_py)
+    elif 'performers' in fields:                                # with a performer table
+        lineups = decode_shared_lineups(fields)
+    return Festival(fields['name'], fields['location'],
+                    date_json_to_py(fields['start']), date_json_to_py(fields['end']), *lineups)
+
+
+DECODERS = {"__Performer__": decode_performer, "__Lineup__": decode_lineup, "__Festival__": decode_festival,
+            "__Lineups__": decode_shared_lineups,
+            **{f"__{name}__": lambda member, cls=cls: cls[member] for name, cls in ENUMS.items()}}
+
+
+def music_json_to_py(music_json):
+    """JSON decoder for Performer, Lineup and Festival objects (object_hook parameter in json.loads()).
+    Reads both the flat format of MusicEncoder and the nested format of PerformerEncoder/LineupEncoder/
+    FestivalEncoder.
+    """
+
+    if len(music_json) != 1:                                   # fields of an object, or an untagged dict
+        return music_json
+    for tag in music_json:
+        decoder = DECODERS.get(tag)
+        if decoder is not None:
+            o = decoder(music_json[tag])
+            return o if o is not None else music_json           # None: lineups with performer ids
+    return music_json
+
+
+def dumps(o, shared_performers=False, **kwargs):
+    """json.dumps() with MusicEncoder (or, without kwargs such as indent, the equivalent to_json()).
+    With shared_performers=True, festivals and lists of lineups are written with a performer table.
+    """
+
+    if kwargs:
+        return json.dumps(LineupList(o) if shared_performers and is_lineup_list(o) else o,
+                          cls=MusicEncoder, shared_performers=shared_performers, **kwargs)
+    return to_json(o, shared_performers)
+
+
+# Schema-directed decoding: json.loads() without object_hook parses the whole document into plain dicts and lists
+# (all in C), and the objects are then built by following the known structure of the JSON, festival -> lineups ->
+# performers, so no Python function is called for the fields dicts of the objects. Only the values not where
+# the schema expects them are decoded generically, bottom-up, as with object_hook=music_json_to_py.
+
+def build(o):
+    """Returns the objects built from o, a JSON value parsed without object_hook (the same as
+    if it was parsed with object_hook=music_json_to_py).
+    """
+
+    if isinstance(o, dict):
+        if len(o) == 1:
+            for tag in o:
+                builder = BUILDERS.get(tag)
+                if builder is not None:
+                    return builder(o[tag])
+        return music_json_to_py({k: build(v) for k, v in o.items()})
+    if isinstance(o, list):
+        return [build(item) for item in o]
+    return o
+
+
+def build_performer(fields):
+    if len(fields) > 2:                                         # more than name and is_band, e.g. {"__Vocals__": ...}
+        fields = {k: build(v) for k, v in fields.items()}
+    return decode_performer(fields)
+
+
+def build_performers(performers):
+    return [build_performer(p["__Performer__"]) if type(p) is dict and "__Performer__" in p else build(p)
+            for p in performers]
+
+
+def build_lineup(fields):
+    performers = fields['performers']
+    if not isinstance(performers, list):                        # the nested format of LineupEncoder
+        return decode_lineup(fields)
+    return Lineup(*build_performers(performers), date=date_json_to_py(fields['date']))
+
+
+def build_shared_lineups(fields):
+    return decode_shared_lineups({'performers': build_performers(fields['performers']), 'lineups': fields['lineups']},
+                                 build)
+
+
+def build_festival(fields):
+    lineups = fields['lineups']
+    if not isinstance(lineups, list):                           # the nested format of FestivalEncoder
+        return decode_festival(fields)
+    if 'performers' in fields:                                  # with a performer table
+        lineups = build_shared_lineups(fields)
+    else:
+        lineups = [build_lineup(l["__Lineup__"]) if type(l) is dict and "__Lineup__" in l else build(l)
+                   for l in lineups]
+    return Festival(fields['name'], fields['location'],
+                    date_json_to_py(fields['start']), date_json_to_py(fields['end']), *lineups)
+
+
+BUILDERS = {**DECODERS, "__Performer__": build_performer, "__Lineup__": build_lineup,
+            "__Festival__": build_festival, "__Lineups__": build_shared_lineups}
+
+
+def loads(s, **kwargs):
+    """Decodes s with json.loads() and build(); the same as json.loads() with object_hook=music_json_to_py,
+    but faster.
+    """
+
+    return build(json.loads(s, **kwargs))
+
+
+def load(fp, shared_performers=False, lines=False):
+    """Reads the objects written by dump() from the text file fp. With lines=True, returns the festival
+    (if the first line is a festival header) or the list of the objects in the lines.
+    """
+
+    if not lines:
+        return loads(fp.read())
+    objects = list(load_lines(fp, shared_performers))
+    if objects and isinstance(objects[0], Festival) and objects[0].lineups == 'unknown':
+        f = objects[0]
+        return Festival(f.name, f.location, f.start, f.end, *objects[1:])
+    return objects
+
+
+def load_lines(fp, shared_performers=False):
+    """Yields the objects from the newline-delimited JSON written by dump(..., lines=True) to fp, one per line,
+    as the lines are read. shared_performers must be the same as in dump(); if True, the ids in lineups
+    are resolved to the shared Performer objects.
+    """
+
+    table = []                                                  # the performers by id
+    for line in fp:
+        if not line.strip():
+            continue
+        o = json.loads(line)
+        fields = o.get("__Lineup__") if shared_performers and type(o) is dict and len(o) == 1 else None
+        if fields is None or not isinstance(fields['performers'], list):
+            yield build(o)
+            continue
+        yield Lineup(*resolve_performers(fields['performers'], table, build), date=date_json_to_py(fields['date']))
+
+
+class JSONReader:
+    """Reads JSON values from a text file incrementally: the file is read in chunks into a buffer,
+    and each value is decoded (json.JSONDecoder.raw_decode()) as soon as it is complete in the buffer.
+    Arrays and objects can also be read element by element (elements(), members()).
+    Positions in the file (tell(), value_start) are in characters; for JSON written with ensure_ascii (the default
+    in json.dumps(), and hence in dumps()/dump()), or if fp is opened with encoding='latin-1', they are in bytes.
+    """
+
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, fp, chunk_size=1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.offset = 0                                         # the position of buffer[0] in the file
+        self.value_start = 0                                    # the position of the last value read in the file
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def tell(self):
+        return self.offset + self.pos
+
+    def read(self):
+        """Reads more of the file into the buffer, dropping what has been decoded already.
+        Returns False at the end of the file.
+        """
+
+        if self.eof:
+            return False
+        # At least as much as is pending, so that a value longer than a chunk is decoded O(log n) times, not O(n)
+        data = self.fp.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.offset += self.pos
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character ('' at the end of the file).
+        """
+
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f'Expecting {char!r}', self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """Returns the next JSON value, as parsed by json.loads() (without object_hook).
+        """
+
+        self.peek()
+        self.value_start = self.tell()
+        while True:
+            try:
+                o, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer) or self.eof:          # a number at the end of the buffer may go on
+                    self.pos = end
+                    return o
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.read()
+
+    def delimiter(self, end):
+        """Reads ',' or end (the end of an array or object); returns True after ','.
+        """
+
+        c = self.peek()
+        if c != ',' and c != end:
+            raise json.JSONDecodeError("Expecting ',' delimiter", self.buffer, self.pos)
+        self.pos += 1
+        return c == ','
+
+    def elements(self):
+        """Yields the elements of the JSON array at the current position, one by one (as value() does).
+        """
+
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        yield self.value()
+        while self.delimiter(']'):
+            yield self.value()
+
+    def members(self):
+        """Yields the keys of the JSON object at the current position. After each key, the reader is at its value,
+        which the caller must read (value(), elements(), members()) before asking for the next key.
+        """
+
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if not self.delimiter('}'):
+                return
+
+
+def iter_lineups(fp, shared_performers=False, lines=False, chunk_size=1 << 16):
+    """Yields the lineups of the festival (or of the list of lineups) written to the text file fp by dump(),
+    one by one, as the file is read. Only the lineup being decoded (and the performer table, if any)
+    is in memory, not the whole festival, so the caller can process each lineup while the rest is being read.
+    The festival itself is not created (its lineups are not validated). With lines=True (and shared_performers
+    as in dump()), reads newline-delimited JSON (see load_lines()). The nested format of FestivalEncoder
+    is also read, but not incrementally.
+    """
+
+    if lines:
+        yield from (o for o in load_lines(fp, shared_performers) if isinstance(o, Lineup))
+        return
+    reader = JSONReader(fp, chunk_size)
+    if reader.peek() == '[':                                    # a list of lineups
+        for o in reader.elements():
+            yield build(o)
+        return
+    for tag in reader.members():
+        if tag not in ("__Festival__", "__Lineups__"):
+            o = build({tag: reader.value()})
+            if isinstance(o, Lineup):
+                yield o
+            continue
+        table = None                                            # the performer table, if any (before the lineups)
+        for key in reader.members():
+            if key == 'performers' and reader.peek() == '[':
+                table = build_performers(reader.elements())
+            elif key == 'lineups' and reader.peek() == '[':
+                for o in reader.elements():
+                    yield decode_shared_lineups({'performers': table, 'lineups': [o]}, build)[0] \
+                        if table is not None else build(o)
+            elif key == 'lineups':                              # the nested format of FestivalEncoder
+                yield from json.loads(reader.value(), object_hook=music_json_to_py)
+            else:
+                reader.value()
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    from datetime import timedelta
+    from pathlib import Path
+    import tempfile
+    from timeit import timeit
+    import tracemalloc
+
+    from woodstock.music.festival import FestivalEncoder, festival_json_to_py
+    from woodstock.music.lineup import LineupEncoder
+
+    # Data
+    melanie = Performer('Melanie', is_band=False)
+    arloGuthrie = Performer('Arlo Guthrie', is_band=False)
+    gratefulDead = Performer('Grateful Dead', is_band=True)
+    theWho = Performer('The Who', is_band=True)
+    jimiHendrix = Performer('Jimi Hendrix', is_band=False)
+    theBand = Performer('The Band', is_band=True)
+    lineups = [Lineup(melanie, arloGuthrie, date=date(1969, 8, 15)),
+               Lineup(gratefulDead, theWho, date=date(1969, 8, 16)),
+               Lineup(jimiHendrix, theBand, date=date(1969, 8, 17))]
+    woodstock = Festival('Woodstock', 'Bethel (NY)', date(1969, 8, 15), date(1969, 8, 17), *lineups)
+
+    woodstock_json = dumps(woodstock, indent=4)
+    print(woodstock_json)
+    print(loads(woodstock_json) == woodstock)
+    print(loads(json.dumps(woodstock, cls=FestivalEncoder, indent=4)) == woodstock)    # reads the nested format
+    print(loads(json.dumps(lineups, cls=LineupEncoder)) == lineups)
+    print(dumps(woodstock) == json.dumps(woodstock, cls=MusicEncoder))
+    print()
+
+    # Size and time: 100 lineups x 1000 performers
+    start = date(1969, 8, 15)
+    big_lineups = [Lineup(*(Performer(f'Performer {i}-{j}', is_band=j % 2 == 0) for j in range(1000)),
+                          date=start + timedelta(days=i)) for i in range(100)]
+    big_festival = Festival('Big', 'Bethel (NY)', start, start + timedelta(days=99), *big_lineups)
+    nested = json.dumps(big_festival, cls=FestivalEncoder, indent=4)
+    flat = dumps(big_festival)
+    print(f'nested {len(nested):,} chars, flat {len(flat):,} chars')
+    print('encode nested:', timeit(lambda: json.dumps(big_festival, cls=FestivalEncoder, indent=4), number=3) / 3)
+    print('encode flat:  ', timeit(lambda: json.dumps(big_festival, cls=MusicEncoder), number=3) / 3)
+    print('encode flat (to_json(), cached performer fragments):', timeit(lambda: dumps(big_festival), number=3) / 3)
+    print('decode nested:', timeit(lambda: json.loads(nested, object_hook=festival_json_to_py), number=3) / 3)
+    print('decode flat:  ', timeit(lambda: loads(flat), number=3) / 3)
+    print()
+
+    # Decoding throughput in objects (performers, lineups, festivals) per second
+    n = 100 * 1000 + 100 + 1
+    for label, decode in (('nested, festival_json_to_py():', lambda: json.loads(nested, object_hook=festival_json_to_py)),
+                          ('flat, music_json_to_py():     ', lambda: json.loads(flat, object_hook=music_json_to_py)),
+                          ('flat, loads() (build()):      ', lambda: loads(flat))):
+        print(label, f'{n / min(timeit(decode, number=1) for _ in range(3)):,.0f} objects/s')
+    print()
+
+    # Performer table: a festival series of 300 lineups x 1000 performers, drawn from 3000 touring performers
+    print(dumps(lineups[:2], shared_performers=True))
+    print(loads(dumps(woodstock, shared_performers=True, indent=4)) == woodstock)
+    print(loads(dumps(lineups, shared_performers=True)) == lineups)
+    def make_tour():
+        touring = [Performer(f'Touring performer {i}', is_band=i % 2 == 0) for i in range(3000)]
+        return Festival('Tour', 'USA', start, start + timedelta(days=299),
+                        *[Lineup(*touring[i % 3 * 1000:(i % 3 + 1) * 1000], date=start + timedelta(days=i))
+                          for i in range(300)])
+    tour = make_tour()
+    flat, shared = dumps(tour), dumps(tour, shared_performers=True)
+    print(f'flat {len(flat):,} chars, shared {len(shared):,} chars')
+    print('encode flat:  ', timeit(lambda: dumps(tour), number=3) / 3)
+    print('encode shared:', timeit(lambda: dumps(tour, shared_performers=True), number=3) / 3)
+    print('decode flat:  ', timeit(lambda: loads(flat), number=3) / 3)
+    print('decode shared:', timeit(lambda: loads(shared), number=3) / 3)
+    for label, s in ('flat:  ', flat), ('shared:', shared):
+        tracemalloc.start()
+        decoded = loads(s)
+        print('decoded size', label, f'{tracemalloc.get_traced_memory()[0]:,} bytes')
+        tracemalloc.stop()
+        del decoded
+    print()
+
+    # Streaming: peak memory of writing the tour to a file, as a whole string and with dump(), each from a new tour
+    # (dumps() fills the caches of the performers, Performer.json_fragment, dump() neither uses nor fills them);
+    # and what remains allocated afterwards
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'tour.json'
+        for label, write in (('dumps():', lambda fp: fp.write(dumps(tour))),
+                             ('dump():', lambda fp: dump(tour, fp)),
+                             ('dump(lines=True):', lambda fp: dump(tour, fp, lines=True)),
+                             ('dump(shared_performers=True):', lambda fp: dump(tour, fp, shared_performers=True)),
+                             ('dump(generator, shared):',
+                              lambda fp: dump((l for l in tour.lineups), fp, shared_performers=True))):
+            tour = make_tour()
+            with open(path, 'w') as fp:
+                tracemalloc.start()
+                write(fp)
+                current, peak = tracemalloc.get_traced_memory()
+                print('write', f'{label:30}', f'peak {peak:,} bytes, retained {current:,} bytes')
+                tracemalloc.stop()
+        with open(path) as fp:
+            print(load(fp) == list(tour.lineups))
+        with open(path, 'w') as fp:
+            dump(tour, fp, lines=True)
+        with open(path) as fp:
+            print(load(fp, lines=True) == tour)
+
+        # Incremental decoding: peak memory of reading the tour's lineups, all at once and one by one
+        for shared_performers in False, True:
+            with open(path, 'w') as fp:
+                dump(tour, fp, shared_performers=shared_performers)
+            with open(path) as fp:
+                print(load(fp) == tour)
+            for label, read in (('load():        ', lambda fp: len(load(fp).lineups)),
+                                ('iter_lineups():', lambda fp: sum(1 for lineup in iter_lineups(fp)))):
+                with open(path) as fp:
+                    tracemalloc.start()
+                    n = read(fp)
+                    print('shared' if shared_performers else 'flat  ', label, n, 'lineups,',
+                          f'peak {tracemalloc.get_traced_memory()[1]:,} bytes')
+                    tracemalloc.stop()
@@ -0,0 +1,378 @@
+"""Memory-mapped columnar snapshots of festival catalogs (Festival, Lineup and Performer data)
+"""
+
+
+from array import array
+from datetime import date
+import mmap
+import struct
+import sys
+
+from woodstock.music.festival import Festival
+from woodstock.music.lineup import Lineup
+from woodstock.music.roles import performer_roles
+from woodstock.music.serialization import performer_table
+from woodstock.music.table import KINDS, VOCALS, INSTRUMENTS, VOCALS_CODES, INSTRUMENT_CODES, \
+    PerformerTable, PerformerRow, kind_code
+from woodstock.music.enums import Role
+
+
+# A snapshot file is a header followed by columns (sections), each one a little-endian array of fixed-width values,
+# starting at a multiple of 8 bytes:
+#   header:     MAGIC, the numbers of festivals, lineups and performers, and (offset, size) of each section
+#   performers: names (offsets + UTF-8 heap), flags (is_band, writes_songs), class, vocals and instrument codes
+#               (as in PerformerTable), Role flags
+#   lineups:    dates (date.toordinal()), and the performers of each lineup as a range [offsets[i], offsets[i + 1])
+#               in lineup_performers (performer rows); performers are written once (as in performer_table())
+#   festivals:  name and location (strings 2 * i and 2 * i + 1, offsets + UTF-8 heap), start and end dates,
+#               and the lineups of each festival as a range of lineup rows
+# A snapshot is opened with mmap, and the columns are memoryviews of the mapped file, so opening it doesn't read
+# the data, and the pages of the file are read by the OS only when (and if) the data in them is accessed.
+
+MAGIC = b'WSTKSNP1'
+HEADER = struct.Struct('<8sQQQ')
+SECTIONS = (('performer_name_offsets', 'Q'), ('performer_names', 'B'), ('performer_flags', 'B'),
+            ('performer_kinds', 'B'), ('performer_vocals', 'B'), ('performer_instruments', 'B'),
+            ('performer_roles', 'H'),
+            ('lineup_dates', 'i'), ('lineup_performer_offsets', 'Q'), ('lineup_performers', 'I'),
+            ('festival_string_offsets', 'Q'), ('festival_strings', 'B'), ('festival_starts', 'i'),
+            ('festival_ends', 'i'), ('festival_lineup_offsets', 'Q'))
+SECTION = struct.Struct('<QQ')                                  # offset, size in bytes
+
+IS_BAND = 1                                                     # performer_flags
+WRITES_SONGS = 2
+
+
+def strings_columns(strings):
+    """Returns the offsets (array('Q')) and the heap (bytes) of a sequence of strings.
+    """
+
+    heap = bytearray()
+    offsets = array('Q', [0])
+    for s in strings:
+        heap += s.encode()
+        offsets.append(len(heap))
+    return offsets, bytes(heap)
+
+
+def write_snapshot(path, festivals):
+    """Writes festivals (a Festival or an iterable of festivals) to the snapshot file at path.
+    """
+
+    festivals = [festivals] if isinstance(festivals, Festival) else list(festivals)
+    lineups = [lineup for festival in festivals if isinstance(festival.lineups, tuple) for lineup in festival.lineups]
+    performers, ids = performer_table(lineups)
+    name_offsets, names = strings_columns(p.name for p in performers)
+    lineup_performer_offsets = array('Q', [0])
+    for lineup_ids in ids:
+        lineup_performer_offsets.append(lineup_performer_offsets[-1] + len(lineup_ids))
+    festival_lineup_offsets = array('Q', [0])
+    for festival in festivals:
+        festival_lineup_offsets.append(festival_lineup_offsets[-1] +
+                                       (len(festival.lineups) if isinstance(festival.lineups, tuple) else 0))
+    string_offsets, strings = strings_columns(s for festival in festivals for s in (festival.name, festival.location))
+    columns = {
+        'performer_name_offsets': name_offsets,
+        'performer_names': names,
+        'performer_flags': bytes(IS_BAND * bool(p.is_band) | WRITES_SONGS * bool(getattr(p, 'writes_songs', False))
+                                 for p in performers),
+        'performer_kinds': bytes(kind_code(p) for p in performers),
+        'performer_vocals': bytes(VOCALS_CODES.get(getattr(p, 'vocals', None), 0) for p in performers),
+        'performer_instruments': bytes(INSTRUMENT_CODES.get(getattr(p, 'instrument', None), 0) for p in performers),
+        'performer_roles': array('H', (performer_roles(p) for p in performers)),
+        'lineup_dates': array('i', (lineup.date.toordinal() for lineup in lineups)),
+        'lineup_performer_offsets': lineup_performer_offsets,
+        'lineup_performers': array('I', (i for lineup_ids in ids for i in lineup_ids)),
+        'festival_string_offsets': string_offsets,
+        'festival_strings': strings,
+        'festival_starts': array('i', (festival.start.toordinal() for festival in festivals)),
+        'festival_ends': array('i', (festival.end.toordinal() for festival in festivals)),
+        'festival_lineup_offsets': festival_lineup_offsets,
+    }
+    data = []
+    offset = HEADER.size + SECTION.size * len(SECTIONS)
+    sections = []
+    for name, typecode in SECTIONS:
+        column = columns[name]
+        if isinstance(column, array) and sys.byteorder == 'big':
+            column = array(typecode, column)
+            column.byteswap()
+        column = bytes(column)
+        offset += -offset % 8
+        sections.append((offset, len(column)))
+        data.append(column)
+        offset += len(column)
+    with open(path, 'wb') as fp:
+        fp.write(HEADER.pack(MAGIC, len(festivals), len(lineups), len(performers)))
+        for section in sections:
+            fp.write(SECTION.pack(*section))
+        for (offset, size), column in zip(sections, data):
+            fp.write(bytes(offset - fp.tell()))                 # padding
+            fp.write(column)
+
+
+class Snapshot:
+    """A snapshot file opened with mmap (see write_snapshot()).
+    Festivals, lineups and performers are accessed through views (SnapshotFestival, SnapshotLineup and
+    PerformerRow, as for PerformerTable) that read the columns only when their properties are used;
+    to_festival(), to_lineup() and to_performer() convert them to objects.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError('snapshots can be opened only on little-endian machines')
+        with open(path, 'rb') as fp:
+            self.__mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.__mmap)
+        magic, self.n_festivals, self.n_lineups, self.n_performers = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            buffer.release()
+            self.__mmap.close()
+            raise ValueError(f'{path}: not a snapshot file')
+        self.__columns = {}
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, size = SECTION.unpack_from(buffer, HEADER.size + i * SECTION.size)
+            self.__columns[name] = buffer[offset:offset + size].cast(typecode)
+        buffer.release()
+        (self.__name_offsets, self.__names, self.__flags, self.__kinds, self.__vocals, self.__instruments,
+         self.__roles, self.__dates, self.__performer_offsets, self.__performers, self.__string_offsets,
+         self.__strings, self.__starts, self.__ends, self.__lineup_offsets) = \
+            [self.__columns[name] for name, typecode in SECTIONS]
+
+    @classmethod
+    def open(cls, path):
+        return cls(path)
+
+    def close(self):
+        for column in self.__columns.values():
+            column.release()
+        self.__mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Festivals
+
+    def __len__(self):
+        return self.n_festivals
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('Snapshot index out of range')
+        return SnapshotFestival(self, i)
+
+    def __iter__(self):
+        return (SnapshotFestival(self, i) for i in range(len(self)))
+
+    def festival_name(self, i):
+        return self.__string(2 * i)
+
+    def festival_location(self, i):
+        return self.__string(2 * i + 1)
+
+    def festival_start(self, i):
+        return date.fromordinal(self.__starts[i])
+
+    def festival_end(self, i):
+        return date.fromordinal(self.__ends[i])
+
+    def festival_lineups(self, i):
+        return range(self.__lineup_offsets[i], self.__lineup_offsets[i + 1])
+
+    def __string(self, i):
+        return str(self.__strings[self.__string_offsets[i]:self.__string_offsets[i + 1]], 'utf-8')
+
+    # Lineups
+
+    def lineup_date(self, i):
+        return date.fromordinal(self.__dates[i])
+
+    def lineup_performers(self, i):
+        """Returns the list of the performer rows of lineup i.
+        """
+
+        return self.__performers[self.__performer_offsets[i]:self.__performer_offsets[i + 1]].tolist()
+
+    def lineup_size(self, i):
+        return self.__performer_offsets[i + 1] - self.__performer_offsets[i]
+
+    # Performers (the same methods as in PerformerTable, for PerformerRow)
+
+    def name(self, i):
+        return str(self.__names[self.__name_offsets[i]:self.__name_offsets[i + 1]], 'utf-8')
+
+    def is_band(self, i):
+        return bool(self.__flags[i] & IS_BAND)
+
+    def writes_songs(self, i):
+        return bool(self.__flags[i] & WRITES_SONGS)
+
+    def kind(self, i):
+        return KINDS[self.__kinds[i]]
+
+    def vocals(self, i):
+        return VOCALS[self.__vocals[i]]
+
+    def instrument(self, i):
+        return INSTRUMENTS[self.__instruments[i]]
+
+    def roles(self, i):
+        return Role(self.__roles[i])
+
+    to_performer = PerformerTable.to_performer
+
+
+class SnapshotFestival:
+    """View of a festival in a Snapshot, which acts like a (read-only) Festival object.
+    """
+
+    __slots__ = ('snapshot', 'index')
+
+    def __init__(self, snapshot, index):
+        self.snapshot = snapshot
+        self.index = index
+
+    @property
+    def name(self):
+        return self.snapshot.festival_name(self.index)
+
+    @property
+    def location(self):
+        return self.snapshot.festival_location(self.index)
+
+    @property
+    def start(self):
+        return self.snapshot.festival_start(self.index)
+
+    @property
+    def end(self):
+        return self.snapshot.festival_end(self.index)
+
+    @property
+    def lineups(self):
+        return tuple(SnapshotLineup(self.snapshot, i) for i in self.snapshot.festival_lineups(self.index))
+
+    def lineup(self, d):
+        """Returns the view of the lineup on date d. Raises KeyError if there is none.
+        """
+
+        for i in self.snapshot.festival_lineups(self.index):
+            if self.snapshot.lineup_date(i) == d:
+                return SnapshotLineup(self.snapshot, i)
+        raise KeyError(d)
+
+    def __str__(self):
+        return str(self.to_festival())
+
+    def to_festival(self):
+        return Festival(self.name, self.location, self.start, self.end, *[lineup.to_lineup() for lineup in self.lineups])
+
+
+class SnapshotLineup:
+    """View of a lineup in a Snapshot, which acts like a (read-only) Lineup object; its performers are PerformerRow
+    views.
+    """
+
+    __slots__ = ('snapshot', 'index')
+
+    def __init__(self, snapshot, index):
+        self.snapshot = snapshot
+        self.index = index
+
+    @property
+    def date(self):
+        return self.snapshot.lineup_date(self.index)
+
+    @property
+    def performers(self):
+        return tuple(PerformerRow(self.snapshot, i) for i in self.snapshot.lineup_performers(self.index))
+
+    def __len__(self):
+        return self.snapshot.lineup_size(self.index)
+
+    def __iter__(self):
+        return iter(self.performers)
+
+    def __str__(self):
+        return str(self.to_lineup())
+
+    def to_lineup(self):
+        return Lineup(*[row.to_performer() for row in self.performers], date=self.date)
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    from datetime import timedelta
+    from pathlib import Path
+    import pickle
+    import tempfile
+    from timeit import timeit
+
+    from woodstock.music.enums import Vocals, Instrumet
+    from woodstock.music.performer import Performer, Singer, SingerSongwriter
+    from woodstock.music.serialization import dump, load
+
+    # Data
+    melanie = SingerSongwriter(name='Melanie', is_band=False,
+                               vocals=Vocals.LEAD_VOCALS, instrument=Instrumet.RHYTHM_GUITAR)
+    joanBaez = Singer(name='Joan Baez', is_band=False, vocals=Vocals.LEAD_VOCALS)
+    theWho = Performer('The Who', is_band=True)
+    woodstock = Festival('Woodstock', 'Bethel (NY)', date(1969, 8, 15), date(1969, 8, 17),
+                         Lineup(melanie, joanBaez, date=date(1969, 8, 15)), Lineup(theWho, date=date(1969, 8, 16)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'woodstock.snapshot'
+        write_snapshot(path, woodstock)
+        with Snapshot.open(path) as snapshot:
+            festival = snapshot[0]
+            print(festival.name, festival.location, festival.start, festival.end)
+            for lineup in festival.lineups:
+                print(lineup.date, [str(p) for p in lineup], [snapshot.roles(row.index) for row in lineup])
+            print(festival.to_festival() == woodstock)
+        print()
+
+        # A catalog of 50 festivals x 100 lineups x 1000 performers, drawn from 20000 touring performers
+        start = date(1969, 8, 15)
+        touring = [Performer(f'Touring performer {i}', is_band=i % 2 == 0) for i in range(20_000)]
+        catalog = [Festival(f'Festival {f}', 'USA', start, start + timedelta(days=99),
+                            *[Lineup(*touring[(f + i) % 20 * 1000:((f + i) % 20 + 1) * 1000],
+                                     date=start + timedelta(days=i)) for i in range(100)])
+                   for f in range(50)]
+        day = start + timedelta(days=50)
+        path = Path(tmp) / 'catalog.snapshot'
+        write_snapshot(path, catalog)
+        with open(Path(tmp) / 'catalog.pickle', 'wb') as fp:
+            pickle.dump(catalog, fp)
+        with open(Path(tmp) / 'catalog.json', 'w') as fp:
+            dump(catalog, fp)
+        for name in 'catalog.snapshot', 'catalog.pickle', 'catalog.json':
+            print(f'{name}: {(Path(tmp) / name).stat().st_size:,} bytes')
+
+        def open_snapshot():
+            with Snapshot.open(path) as snapshot:
+                return len(snapshot)
+
+        def one_lineup_snapshot():
+            with Snapshot.open(path) as snapshot:
+                return [p.name for p in snapshot[25].lineup(day)]
+
+        def one_lineup_pickle():
+            with open(Path(tmp) / 'catalog.pickle', 'rb') as fp:
+                return [p.name for p in pickle.load(fp)[25].lineups[50]]
+
+        def one_lineup_json():
+            with open(Path(tmp) / 'catalog.json') as fp:
+                return [p.name for p in load(fp)[25].lineups[50]]
+
+        print('open snapshot:            ', timeit(open_snapshot, number=10) / 10)
+        print('open snapshot, one lineup:', timeit(one_lineup_snapshot, number=10) / 10)
+        print('pickle.load(), one lineup:', timeit(one_lineup_pickle, number=1))
+        print('JSON load(), one lineup:  ', timeit(one_lineup_json, number=1))
+        print(one_lineup_snapshot() == one_lineup_pickle() == one_lineup_json())
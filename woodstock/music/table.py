@@ -0,0 +1,317 @@
+"""Columnar storage of Performer objects, for analytics over millions of performers
+"""
+
+
+from array import array
+import re
+
+from woodstock.music.enums import Vocals, Instrumet
+from woodstock.music.performer import Performer, Singer, Songwriter, SingerSongwriter, SingerBase, SongwriterBase, \
+    SlottedPerformer, SlottedSinger, SlottedSongwriter, SlottedSingerSongwriter, performer_fields
+
+try:
+    import numpy as np                                                  # optional: vectorized filters
+except ImportError:
+    np = None
+
+
+# Column codes; 0 always means 'none'
+KINDS = (Performer, Singer, Songwriter, SingerSongwriter,
+         SlottedPerformer, SlottedSinger, SlottedSongwriter, SlottedSingerSongwriter)
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+VOCALS = (None, *Vocals)
+VOCALS_CODES = {vocals: code for code, vocals in enumerate(VOCALS)}
+INSTRUMENTS = (None, *Instrumet)
+INSTRUMENT_CODES = {instrument: code for code, instrument in enumerate(INSTRUMENTS)}
+
+# _UNPACKED_BITS[b] is the byte b of a bitset unpacked to 8 bytes (one per bit, least significant bit first)
+_UNPACKED_BITS = [bytes((b >> k) & 1 for k in range(8)) for b in range(256)]
+# _MATCHES[code] is the bytes.translate() table that maps code to 1 and all other byte values to 0
+_MATCHES = [bytes(1 if b == code else 0 for b in range(256)) for code in range(256)]
+
+
+def kind_code(performer):
+    """Returns the code of the performer's class in KINDS (for subclasses, the code of the nearest class in KINDS).
+    """
+
+    for cls in type(performer).__mro__:
+        if cls in KIND_CODES:
+            return KIND_CODES[cls]
+    return KIND_CODES[Performer]
+
+
+class PerformerTable:
+    """Columnar container of performers.
+    Names are stored in one contiguous UTF-8 buffer with an offsets array, is_band and writes_songs in bitsets,
+    and the class, vocals and instrument of each performer as 1-byte codes (see KINDS, VOCALS and INSTRUMENTS).
+    Filters (where(), solo(), bands(),...) run over whole columns - with NumPy if it is installed,
+    and with C-level bytes/re operations otherwise - and return row indices.
+    Rows are accessed as zero-copy PerformerRow views; to_performers() converts back to Performer objects.
+    """
+
+    def __init__(self, performers=()):
+        self.__names = bytearray()
+        self.__offsets = array('Q', [0])
+        self.__bands = bytearray()
+        self.__songwriters = bytearray()
+        self.__kinds = array('B')
+        self.__vocals = array('B')
+        self.__instruments = array('B')
+        self.extend(performers)
+
+    @classmethod
+    def from_performers(cls, performers):
+        return cls(performers)
+
+    def append(self, performer):
+        i = len(self.__kinds)
+        if i % 8 == 0:
+            self.__bands.append(0)
+            self.__songwriters.append(0)
+        self.__names += performer.name.encode()
+        self.__offsets.append(len(self.__names))
+        if performer.is_band:
+            self.__bands[i >> 3] |= 1 << (i & 7)
+        if getattr(performer, 'writes_songs', False):
+            self.__songwriters[i >> 3] |= 1 << (i & 7)
+        self.__kinds.append(kind_code(performer))
+        self.__vocals.append(VOCALS_CODES.get(getattr(performer, 'vocals', None), 0))
+        self.__instruments.append(INSTRUMENT_CODES.get(getattr(performer, 'instrument', None), 0))
+
+    def extend(self, performers):
+        for performer in performers:
+            self.append(performer)
+
+    def __len__(self):
+        return len(self.__kinds)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('PerformerTable index out of range')
+        return PerformerRow(self, i)
+
+    def __iter__(self):
+        return (PerformerRow(self, i) for i in range(len(self)))
+
+    def rows(self, indices):
+        """Returns a generator of the PerformerRow views of the rows with the given indices.
+        """
+
+        return (PerformerRow(self, i) for i in indices)
+
+    # Column access for single rows
+
+    def name(self, i):
+        return self.__names[self.__offsets[i]:self.__offsets[i + 1]].decode()
+
+    def is_band(self, i):
+        return bool(self.__bands[i >> 3] >> (i & 7) & 1)
+
+    def writes_songs(self, i):
+        return bool(self.__songwriters[i >> 3] >> (i & 7) & 1)
+
+    def kind(self, i):
+        return KINDS[self.__kinds[i]]
+
+    def vocals(self, i):
+        return VOCALS[self.__vocals[i]]
+
+    def instrument(self, i):
+        return INSTRUMENTS[self.__instruments[i]]
+
+    # Vectorized filters
+
+    def where(self, is_band=None, vocals=None, instrument=None):
+        """Returns the indices of the rows that satisfy all the specified conditions, in ascending order
+        (a NumPy array if NumPy is installed, an array('Q') otherwise).
+        """
+
+        conditions = []
+        if is_band is not None:
+            conditions.append((self.__bands, True, 1 if is_band else 0))
+        if vocals is not None:
+            conditions.append((self.__vocals, False, VOCALS_CODES[vocals]))
+        if instrument is not None:
+            conditions.append((self.__instruments, False, INSTRUMENT_CODES[instrument]))
+        if np is not None:
+            return self.__where_numpy(conditions)
+        return self.__where_bytes(conditions)
+
+    def __where_numpy(self, conditions):
+        n = len(self)
+        mask = np.ones(n, dtype=bool)
+        for column, is_bitset, code in conditions:
+            values = np.frombuffer(column, dtype=np.uint8)
+            if is_bitset:
+                values = np.unpackbits(values, bitorder='little')[:n]
+            mask &= values == code
+        return np.flatnonzero(mask)
+
+    def __where_bytes(self, conditions):
+        n = len(self)
+        mask = b'\x01' * n
+        for column, is_bitset, code in conditions:
+            values = self.__unpacked(column) if is_bitset else column.tobytes()
+            matches = values.translate(_MATCHES[code])
+            mask = (int.from_bytes(mask, 'little') & int.from_bytes(matches, 'little')).to_bytes(n, 'little')
+        return array('Q', (m.start() for m in re.finditer(b'\x01', mask)))
+
+    def __unpacked(self, bitset):
+        return b''.join(map(_UNPACKED_BITS.__getitem__, bitset))[:len(self)]
+
+    def solo(self):
+        return self.where(is_band=False)
+
+    def bands(self):
+        return self.where(is_band=True)
+
+    def with_vocals(self, vocals):
+        return self.where(vocals=vocals)
+
+    def with_instrument(self, instrument):
+        return self.where(instrument=instrument)
+
+    # Conversion to objects
+
+    def to_performer(self, i):
+        """Creates the Performer object (of the original class) corresponding to row i.
+        """
+
+        kind = self.kind(i)
+        kwargs = {'name': self.name(i), 'is_band': self.is_band(i)}
+        if issubclass(kind, SingerBase):
+            kwargs['vocals'] = self.vocals(i)
+        if issubclass(kind, SongwriterBase):
+            kwargs['instrument'] = self.instrument(i)
+        performer = kind(**kwargs)
+        if issubclass(kind, SongwriterBase):
+            performer.writes_songs = self.writes_songs(i)
+        return performer
+
+    def to_performers(self, indices=None):
+        return [self.to_performer(i) for i in (range(len(self)) if indices is None else indices)]
+
+
+class PerformerRow(Performer):
+    """Zero-copy view of a row in a PerformerTable, which acts like a (read-only) Performer object.
+    A subclass of Performer whose name and is_band are read from the table (Performer.__init__() is not used).
+    """
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def _attach(self, lineup):
+        pass                                                    # never renamed, so it needs no owner links
+
+    def _fields(self):
+        # The row's columns, as the data fields of the performer it stands for (see performer_fields()),
+        # so that every encoder sees them (the row's own __dict__ is empty)
+        return performer_fields(self.to_performer())
+
+    def __reduce__(self):
+        return PerformerRow, (self.table, self.index)           # a view again, not a copy of the columns' values
+
+    @property
+    def name(self):
+        return self.table.name(self.index)
+
+    @property
+    def is_band(self):
+        return self.table.is_band(self.index)
+
+    @property
+    def vocals(self):
+        return self.table.vocals(self.index)
+
+    @property
+    def instrument(self):
+        return self.table.instrument(self.index)
+
+    @property
+    def writes_songs(self):
+        return self.table.writes_songs(self.index)
+
+    @property
+    def kind(self):
+        return self.table.kind(self.index)
+
+    def __str__(self):
+        kind = self.kind
+        if issubclass(kind, SingerBase) and issubclass(kind, SongwriterBase):
+            return Singer.__str__(self) + f', songwriter ({self.instrument.name.lower().replace("_", " ")})'
+        if issubclass(kind, SingerBase):
+            return Singer.__str__(self)
+        if issubclass(kind, SongwriterBase):
+            return Songwriter.__str__(self)
+        name = self.name                                        # as in Performer.__str__(), without its cache
+        return (name + ' (band)' if self.is_band else name + ' (solo performer)') if name != 'unknown' else 'unknown'
+
+    @property
+    def json_fragment(self):
+        return self.to_performer().json_fragment
+
+    def to_performer(self):
+        return self.table.to_performer(self.index)
+
+
+if __name__ == "__main__":
+
+    # pass
+
+    from datetime import date
+    import json
+    from random import seed, choice, random
+    from timeit import timeit
+
+    from woodstock.music.lineup import Lineup
+    from woodstock.music.performer import PerformerEncoder
+    from woodstock.music.serialization import MusicEncoder, dumps
+    from woodstock.util import utility
+
+    # Data
+    melanie = SingerSongwriter(name='Melanie', is_band=False,
+                               vocals=Vocals.LEAD_VOCALS, instrument=Instrumet.RHYTHM_GUITAR)
+    rogerDaltrey = Singer(name='Roger Daltrey', vocals=Vocals.LEAD_VOCALS)
+    peteTownshend = Songwriter(name='Pete Townshend', instrument=Instrumet.LEAD_GUITAR)
+    theWho = Performer('The Who', is_band=True)
+    jimiHendrix = Performer('Jimi Hendrix', is_band=False)
+
+    table = PerformerTable.from_performers([melanie, rogerDaltrey, peteTownshend, theWho, jimiHendrix])
+    print(len(table))
+    for row in table:
+        print(row, '|', row == row.to_performer())
+    print([table[i].name for i in table.solo()])
+    print([table[i].name for i in table.with_instrument(Instrumet.LEAD_GUITAR)])
+    print([table[i].name for i in table.where(is_band=False, vocals=Vocals.LEAD_VOCALS)])
+    print([str(p) for p in table.to_performers()])
+    # Rows encode as the performers they stand for, with both encoders
+    print(all(json.dumps(row, cls=encoder) == json.dumps(row.to_performer(), cls=encoder)
+              for row in table for encoder in (PerformerEncoder, MusicEncoder)))
+    print(json.dumps(table[0], cls=MusicEncoder))
+    print(dumps(Lineup(*table, date=date(1969, 8, 16)), indent=1) ==
+          dumps(Lineup(*table.to_performers(), date=date(1969, 8, 16)), indent=1))
+    print()
+
+    # Filtering 1,000,000 performers: table vs. list of objects
+    seed(1969)
+    n = 1_000_000
+    performers = [Songwriter(name=f'Performer {i}', is_band=random() < 0.3, instrument=choice(list(Instrumet)))
+                  for i in range(n)]
+    table = PerformerTable(performers)
+    print('NumPy:', np is not None)
+    print('objects:', timeit(lambda: [p for p in performers if p.instrument == Instrumet.LEAD_GUITAR], number=5) / 5)
+    print('table:  ', timeit(lambda: table.with_instrument(Instrumet.LEAD_GUITAR), number=5) / 5)
+    print('objects:', timeit(lambda: [p for p in performers
+                                      if not p.is_band and p.instrument == Instrumet.LEAD_GUITAR], number=5) / 5)
+    print('table:  ', timeit(lambda: table.where(is_band=False, instrument=Instrumet.LEAD_GUITAR), number=5) / 5)
+    print()
+
+    # Memory per performer (bytes)
+    print(utility.measure_memory(lambda i: Performer(f'Performer {i}', is_band=False)))
+    print(utility.measure_memory(lambda i: PerformerTable([Performer(f'Performer {j}', is_band=False)
+                                                           for j in range(1000)]), n=100) / 1000)
@@ -4,28 +4,33 @@
 from enum import Enum
 from datetime import date
 from pathlib import Path
+import sys
+import tracemalloc
 
 # from woodstock import settings
 from woodstock.settings import *
 
 
-def format_date(a_date):
-    """Converts a date from datetime.date() to a string of the form '<month> <day>, <year>'.
-    Uses strftime() method of datetime.date class and its pre-defined format codes from
-    https://docs.python.org/3/library/datetime.html#strftime-and-strptime-format-codes
-    """
-
-    return a_date.strftime('%b %d, %Y') if isinstance(a_date, date) else 'unknown'
+# format_date() converts a date from datetime.date() to a string of the form '<month> <day>, <year>',
+# with strftime() method of datetime.date class and its pre-defined format codes from
+# https://docs.python.org/3/library/datetime.html#strftime-and-strptime-format-codes;
+# it is in the date codec module (woodstock.util.dates), with parse_date() and the JSON (ISO) conversions,
+# all cached in memo tables
+from woodstock.util.dates import format_date, parse_date, date_py_to_json, date_json_to_py
 
 
-def date_py_to_json(a_date):
-    """Converts datetime.date objects to JSON.
+def measure_memory(factory, n=100_000):
+    """Returns the average number of bytes allocated per object when creating n objects with factory(i),
+    i = 0, 1,..., n-1, measured with tracemalloc (i.e., including everything the objects allocate).
     """
 
-
-def date_json_to_py(iso_date):
-    """Converts string formatted as 'YYYY-mm-dd' to datetime.date object.
-    """
+    [factory(i) for i in range(100)]                                        # warm-up (caches, interned constants)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return round((after - before - sys.getsizeof(objects)) / len(objects), 1)
 
 
 def get_project_dir():